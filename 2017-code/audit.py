@@ -8,17 +8,20 @@ Routines to work with multi.py on post-election audits.
 """
 
 
+import hashlib
+import json
 import os
 import time
 
 import multi
 import csv_readers
 import ids
-import outcomes
 import planner
 import risk_bayes
 import saved_state
+import timings
 import utils
+import vote_store
 
 
 ##############################################################################
@@ -42,8 +45,9 @@ def draw_sample(e):
 
     Draw sample is in quotes since it just looks at the first
         e.sn_tp[stage_time][pbcid] 
-    elements of 
-        e.av_cpb[cid][pbcid].
+    ballots of each collection in the columnar vote store
+        e.av_code_cp[cid][pbcid]
+    (see vote_store.py; set by read_audited_votes).
     Code sets 
         e.sn_tcpr[e.stage_time][cid][pbcid][r] 
     to number of votes in sample with reported vote r.
@@ -60,7 +64,7 @@ def draw_sample(e):
     else:
         e.sn_tp[e.stage_time] = { pbcid: int(e.max_audit_rate_p[pbcid])
                                   for pbcid in e.pbcids }
-        
+
     e.sn_tcpr[e.stage_time] = {}
     for cid in e.cids:
         e.sn_tcpra[e.stage_time][cid] = {}
@@ -71,28 +75,89 @@ def draw_sample(e):
             e.sn_tcpr[e.stage_time][cid][pbcid] = {}
 
             sample_size = int(e.sn_tp[e.stage_time][pbcid])
-            sample_bids = e.bids_p[pbcid][:sample_size]
-
-            avs = []
-            rvs = []
-            for bid in sample_bids:
-                # actual
-                if bid in e.av_cpb[cid][pbcid]:
-                    avs.append(e.av_cpb[cid][pbcid][bid])
-                else:
-                    avs.append(("-NoSuchContest",))
-                # reported
-                if bid in e.rv_cpb[cid][pbcid]:
-                    rvs.append(e.rv_cpb[cid][pbcid][bid])
-                else:
-                    rvs.append(("-NoSuchContest",))
-            arvs = list(zip(avs, rvs))  # list of (actual, reported) vote pairs
-
-            e.sn_tcpra[e.stage_time][cid][pbcid] = outcomes.compute_tally2(arvs)
 
+            # tallies of (actual, reported) vote pairs, and of reported votes
+            e.sn_tcpra[e.stage_time][cid][pbcid] = \
+                vote_store.sample_tally2(e, cid, pbcid, sample_size)
+
+            vote_symbols = e.vote_symbols_c[cid]
+            rv_counts = vote_store.reported_vote_counts(e, cid, pbcid,
+                                                        sample_size)
             for r in e.rn_cpr[cid][pbcid]:
-                e.sn_tcpr[e.stage_time][cid][pbcid][r] = len(
-                    [rr for rr in rvs if rr == r])
+                e.sn_tcpr[e.stage_time][cid][pbcid][r] = \
+                    int(rv_counts[vote_symbols.code(r)])
+
+
+def compute_sample_digests(e):
+    """
+    Set e.sn_digest_tcp[e.stage_time][cid][pbcid] to a SHA256 hex digest
+    of the sample tally e.sn_tcpra[e.stage_time][cid][pbcid], so that
+    later stages can tell whether the tally has changed.
+    """
+
+    e.sn_digest_tcp[e.stage_time] = {}
+    for cid in e.cids:
+        e.sn_digest_tcp[e.stage_time][cid] = {}
+        for pbcid in sorted(e.possible_pbcid_c[cid]):
+            tally2 = e.sn_tcpra[e.stage_time][cid][pbcid]
+            tally2_list = sorted([list(rv), list(av), tally2[rv][av]]
+                                 for rv in tally2
+                                 for av in tally2[rv])
+            tally2_string = json.dumps(tally2_list)
+            e.sn_digest_tcp[e.stage_time][cid][pbcid] = \
+                hashlib.sha256(tally2_string.encode()).hexdigest()
+
+
+def measurements_to_update(e):
+    """
+    Return list of mids (in the order of e.mids) whose risks need to be
+    computed in an incremental stage: those with no risk in the saved
+    state, those whose risk computation was interrupted (so that their
+    saved risk is only a partial estimate), and those still Open for
+    which the sample tally for some pbcid has changed since the saved
+    state.  (The risks of the others can be carried forward; see
+    carry_forward_risks.)
+    """
+
+    ss = e.saved_state
+    last_stage_time = ss["stage_time"]
+    last_risk_m = ss.get("risk_tm", {}).get(last_stage_time, {})
+    last_status_m = ss["status_tm"][last_stage_time]
+    last_digest_cp = ss.get("sn_digest_tcp", {}).get(last_stage_time, {})
+    last_interrupted_mids = ss.get("interrupted_mids", [])
+
+    mids = []
+    for mid in e.mids:
+        cid = e.cid_m[mid]
+        if mid not in last_risk_m or mid in last_interrupted_mids:
+            mids.append(mid)
+        elif last_status_m[mid] == "Open" and \
+             last_digest_cp.get(cid) != e.sn_digest_tcp[e.stage_time][cid]:
+            mids.append(mid)
+    return mids
+
+
+def carry_forward_risks(e, mids):
+    """
+    Set risks (and numbers of trials) of measurements not in mids to
+    those recorded in the saved state.
+    """
+
+    ss = e.saved_state
+    for mid in e.mids:
+        if mid not in mids:
+            e.risk_tm[e.stage_time][mid] = \
+                ss["risk_tm"][ss["stage_time"]][mid]
+            e.trials_tm[e.stage_time][mid] = \
+                ss["trials_tm"][ss["stage_time"]][mid]
+            e.risk_se_tm[e.stage_time][mid] = \
+                ss.get("risk_se_tm", {}).get(ss["stage_time"], {}).get(
+                    mid, risk_bayes.risk_standard_error(
+                        e.risk_tm[e.stage_time][mid],
+                        e.trials_tm[e.stage_time][mid]))
+            e.ess_tm[e.stage_time][mid] = \
+                ss.get("ess_tm", {}).get(ss["stage_time"], {}).get(
+                    mid, float(e.trials_tm[e.stage_time][mid]))
 
 
 def show_sample_counts(e):
@@ -117,6 +182,10 @@ def compute_statuses(e):
     """ 
     Compute status of each measurement and of election, from 
     already-computed measurement risks.
+
+    A measurement whose risk computation was interrupted (one of
+    e.interrupted_mids) has only a partial estimate of its risk, which
+    is not enough to pass it or declare it upset; it stays Open.
     """
 
     for mid in e.mids:
@@ -129,6 +198,8 @@ def compute_statuses(e):
                     for cid in e.possible_pbcid_c
                     for pbcid in e.possible_pbcid_c[cid]]):
                 e.status_tm[e.stage_time][mid] = "Exhausted"
+            elif mid in e.interrupted_mids:
+                pass
             elif e.risk_tm[e.stage_time][mid] < e.risk_limit_m[mid]:
                 e.status_tm[e.stage_time][mid] = "Passed"
             elif e.risk_tm[e.stage_time][mid] > e.risk_upset_m[mid]:
@@ -153,6 +224,9 @@ def show_risks_and_statuses(e):
                       e.risk_method_m[mid],
                       e.sampling_mode_m[mid],
                       "Risk={}".format(e.risk_tm[e.stage_time][mid]),
+                      "SE={:.3g}".format(e.risk_se_tm[e.stage_time][mid]),
+                      "Trials={}".format(e.trials_tm[e.stage_time][mid]),
+                      "ESS={:.0f}".format(e.ess_tm[e.stage_time][mid]),
                       "(limits {},{})".format(e.risk_limit_m[mid],
                                               e.risk_upset_m[mid]),
                       e.status_tm[e.stage_time][mid])
@@ -309,6 +383,24 @@ def check_audit_spec(e):
         if not (0.0 <= float(e.risk_limit_m[mid]) <= 1.0):
             utils.mywarning("e.risk_limit_m[{}] not in interval [0,1]".format(mid))
 
+    for mid in e.mids:
+        if e.risk_method_m[mid] == "Bayes" and \
+           risk_bayes.risk_engine(e, mid) not in risk_bayes.RISK_ENGINES:
+            utils.mywarning("Risk engine `{}` for measurement {} is not one of {}."
+                            .format(risk_bayes.risk_engine(e, mid), mid,
+                                    risk_bayes.RISK_ENGINES))
+        if risk_bayes.risk_engine(e, mid) == "adaptive":
+            confidence = e.risk_measurement_parameters_m[mid][1].strip()
+            try:
+                valid = confidence == "" or 0.0 < float(confidence) < 1.0
+            except ValueError:
+                valid = False
+            if not valid:
+                utils.myerror("Confidence level (Param 2) `{}` for adaptive "
+                              "measurement {} is not a number strictly "
+                              "between 0 and 1."
+                              .format(confidence, mid))
+
     if not isinstance(e.max_audit_rate_p, dict):
         utils.myerror("e.max_audit_rate_p is not a dict.")
     for pbcid in e.max_audit_rate_p:
@@ -380,6 +472,8 @@ def show_audit_stage_header(e):
 def read_audited_votes(e):
     """ 
     Read audited votes from 3-audit/33-audited-votes/audited-votes-PBCID.csv 
+    into the columnar vote store e.av_code_cp (see vote_store.py).
+    Return number of rows read.
     """
 
     election_pathname = os.path.join(multi.ELECTIONS_ROOT,
@@ -387,6 +481,8 @@ def read_audited_votes(e):
     audited_votes_pathname = os.path.join(election_pathname,
                                           "3-audit",
                                           "33-audited-votes")
+    av_cpb = {}
+    n_rows = 0
     for pbcid in e.pbcids:
         safe_pbcid = ids.filename_safe(pbcid)
         filename = utils.greatest_name(audited_votes_pathname,
@@ -394,13 +490,16 @@ def read_audited_votes(e):
                                        ".csv")
         file_pathname = os.path.join(audited_votes_pathname, filename)
         fieldnames = ["Collection", "Ballot id", "Contest", "Selections"]
-        rows = csv_readers.read_csv_file(file_pathname, fieldnames, varlen=True)
-        for row in rows:
+        for row in csv_readers.iter_csv_file(file_pathname, fieldnames,
+                                             varlen=True):
             pbcid = row["Collection"]
             bid = row["Ballot id"]
             cid = row["Contest"]
             vote = row["Selections"]
-            utils.nested_set(e.av_cpb, [cid, pbcid, bid], vote)
+            utils.nested_set(av_cpb, [cid, pbcid, bid], vote)
+            n_rows += 1
+    vote_store.build_audited_vote_store(e, av_cpb)
+    return n_rows
 
 
 def audit_stage(e, stage_time):
@@ -416,34 +515,70 @@ def audit_stage(e, stage_time):
     ### TBD: filter file inputs by e.stage_time
 
     e.stage_time = "{}".format(stage_time)
+    e.timings_t[e.stage_time] = []
 
-    saved_state.read_saved_state(e)
+    with timings.timed(e, "read_saved_state"):
+        saved_state.read_saved_state(e)
 
     e.status_tm[e.stage_time] = {}
     e.sn_tp[e.stage_time] = {}
 
     e.risk_tm[e.stage_time] = {}
+    e.trials_tm[e.stage_time] = {}
+    e.risk_se_tm[e.stage_time] = {}
+    e.ess_tm[e.stage_time] = {}
     e.sn_tcpra[e.stage_time] = {}
 
     # this is global read, not just per stage, for now
-    read_audited_votes(e)
-
-    draw_sample(e)
-    risk_bayes.compute_risks(e, e.sn_tcpra)
-    compute_statuses(e)
-
-    write_audit_output_contest_status(e)
-    write_audit_output_collection_status(e)
-
-    show_audit_stage_header(e)
-    show_sample_counts(e)
-    show_risks_and_statuses(e)
+    with timings.timed(e, "read_audited_votes") as record:
+        record["Rows"] = read_audited_votes(e)
+
+    with timings.timed(e, "draw_sample") as record:
+        draw_sample(e)
+        compute_sample_digests(e)
+        # ballots sampled (each counted once, however many contests)
+        record["Rows"] = sum(int(e.sn_tp[e.stage_time][pbcid])
+                             for pbcid in e.pbcids)
+        record["Strata"] = sum(len(e.sn_tcpra[e.stage_time][cid][pbcid])
+                               for cid in e.cids
+                               for pbcid in e.possible_pbcid_c[cid])
+
+    with timings.timed(e, "compute_risks") as record:
+        if e.incremental:
+            mids = measurements_to_update(e)
+            carry_forward_risks(e, mids)
+            utils.myprint("    Incremental stage: computing risks for {} of {} "
+                          "measurements.".format(len(mids), len(e.mids)))
+            risk_bayes.compute_risks(e, e.sn_tcpra, mids=mids)
+        else:
+            risk_bayes.compute_risks(e, e.sn_tcpra)
+        # each group of measurements ran its trials once (see the
+        # compute_risk timings); cached and carried-forward risks ran none
+        record["Trials"] = sum(group_record.get("Trials", 0)
+                               for group_record in e.timings_t[e.stage_time]
+                               if group_record["Phase"] == "compute_risk")
+
+    with timings.timed(e, "compute_statuses"):
+        compute_statuses(e)
+
+    with timings.timed(e, "write_outputs"):
+        write_audit_output_contest_status(e)
+        write_audit_output_collection_status(e)
+
+    with timings.timed(e, "show_outputs"):
+        show_audit_stage_header(e)
+        show_sample_counts(e)
+        show_risks_and_statuses(e)
+
+    timings.write_audit_output_timings(e)
 
 
 def write_audit_output_contest_status(e):
     """
     Write audit_output_contest_status; same format as audit_spec_contest,
-    except for status field.
+    except for status field, and with the measured risk, the number of
+    trials used to estimate it, its standard error, and the effective
+    sample size appended.
     """
 
     dirpath = os.path.join(multi.ELECTIONS_ROOT,
@@ -462,7 +597,11 @@ def write_audit_output_contest_status(e):
                       "Sampling Mode",
                       "Status",
                       "Param 1",
-                      "Param 2"]
+                      "Param 2",
+                      "Risk",
+                      "Trials",
+                      "Risk SE",
+                      "ESS"]
         file.write(",".join(fieldnames))
         file.write("\n")
         for mid in e.mids:
@@ -474,7 +613,11 @@ def write_audit_output_contest_status(e):
             file.write("{},".format(e.sampling_mode_m[mid]))
             file.write("{},".format(e.status_tm[e.stage_time][mid]))
             file.write("{},".format(e.risk_measurement_parameters_m[mid][0]))
-            file.write("{}".format(e.risk_measurement_parameters_m[mid][1]))
+            file.write("{},".format(e.risk_measurement_parameters_m[mid][1]))
+            file.write("{},".format(e.risk_tm[e.stage_time][mid]))
+            file.write("{},".format(e.trials_tm[e.stage_time][mid]))
+            file.write("{},".format(e.risk_se_tm[e.stage_time][mid]))
+            file.write("{}".format(e.ess_tm[e.stage_time][mid]))
             file.write("\n")
 
 def write_audit_output_collection_status(e):
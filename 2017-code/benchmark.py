@@ -0,0 +1,336 @@
+# benchmark.py
+# python3
+
+"""
+Benchmarks for the risk computations of risk_bayes.py.
+
+Builds elections in memory, either from the syn2 specs in
+elections/syn2_specs (see syn2.py) or from synthetic specs with given
+numbers of contests, collections, and selections, and times
+risk_bayes.compute_risk and risk_bayes.compute_risks on them, for each
+risk engine and number of trials.  The timings are written to a CSV
+file, one row per timing, so that runs made before and after a change
+to the risk engines can be compared.
+
+Usage:
+    python3 benchmark.py [--quick] [--engines E1,E2,...]
+                         [--trials T1,T2,...] [--output FILE]
+"""
+
+import argparse
+import contextlib
+import io
+import numpy as np
+import os
+import time
+
+import multi
+import audit
+import election_spec
+import ids
+import reported
+import risk_bayes
+import syn
+import syn2
+import utils
+import vote_store
+
+
+# Engines benchmarked by default; "analytic" stands for the "Analytic"
+# risk measurement method.
+BENCHMARK_ENGINES = risk_bayes.RISK_ENGINES + ["analytic"]
+
+BENCHMARK_STAGE_TIME = "2000-00-00-00-00-00"
+
+
+##############################################################################
+# Election specs
+
+def selection_names(n_selections):
+    """ Return list of n_selections selection ids; the first is "Alice". """
+
+    names = ["Alice", "Bob", "Carol", "Dave", "Eve", "Frank"]
+    return (names + ["Sel{}".format(i) for i in range(len(names)+1,
+                                                       n_selections+1)]) \
+        [:n_selections]
+
+
+def synthetic_spec(n_contests, n_collections, n_selections, n_ballots):
+    """
+    Return list of (cid, pbcid, rv, av, num) tuples for syn2.process_spec,
+    describing an election with n_contests contests, each with n_selections
+    selections and n_ballots ballots in each of n_collections collections.
+
+    Alice (the reported winner; see syn2.process_spec) gets the most
+    votes, the other selections successively fewer.  In each collection
+    one percent of the ballots are reported for Alice but are actually for
+    Bob, and one percent are reported and actually "-Invalid", so each
+    contest has n_collections * (n_selections + 1) strata.
+    """
+
+    selids = selection_names(n_selections)
+    weights = np.array([max(1.0 - 0.05 * i, 0.1) for i in range(n_selections)])
+    n_errors = n_ballots // 100
+    n_correct = n_ballots - n_errors * (2 if n_selections > 1 else 1)
+    counts = np.floor(n_correct * weights / weights.sum())
+    counts[0] += n_correct - counts.sum()
+    L = []
+    for c in range(1, n_contests+1):
+        cid = "Contest{}".format(c)
+        for p in range(1, n_collections+1):
+            pbcid = "PBC{}".format(p)
+            for (selid, count) in zip(selids, counts):
+                L.append((cid, pbcid, (selid,), (selid,), int(count)))
+            if n_selections > 1:
+                L.append((cid, pbcid, ("Alice",), ("Bob",), n_errors))
+            L.append((cid, pbcid, ("-Invalid",), ("-Invalid",), n_errors))
+    return L
+
+
+def syn2_spec_names():
+    """ Return sorted list of names of specs in elections/syn2_specs. """
+
+    syn2_pathname = os.path.join(multi.ELECTIONS_ROOT, "syn2_specs")
+    return sorted(filename[:-4] for filename in os.listdir(syn2_pathname)
+                  if filename.endswith(".csv"))
+
+
+def read_syn2_spec(name):
+    """ Return list of tuples for syn2.process_spec, read from named spec. """
+
+    synpar = syn.Syn_Params()
+    synpar.election_dirname = name
+    return syn2.read_syn2_csv(None, synpar)
+
+
+##############################################################################
+# Elections
+
+def build_election(L, sample_size, seed=1):
+    """
+    Return multi.Election built from spec L (as for syn2.process_spec),
+    with a sample of sample_size ballots drawn from each collection,
+    ready for risk_bayes.compute_risks.
+    """
+
+    e = multi.Election()
+    e.election_dirname = "benchmark"
+    synpar = syn.Syn_Params()
+    with contextlib.redirect_stdout(io.StringIO()):
+        syn2.process_spec(e, synpar, L)
+    synpar.RandomState = np.random.RandomState(seed)
+    syn2.shuffle_votes(e, synpar)
+    election_spec.finish_election_spec(e)
+    reported.finish_reported(e)
+
+    audit.set_audit_seed(e, seed)
+    for pbcid in e.pbcids:
+        e.max_audit_rate_p[pbcid] = min(sample_size, len(e.bids_p[pbcid]))
+    e.stage_time = BENCHMARK_STAGE_TIME
+    e.saved_state = {}
+    e.sn_tcpra[e.stage_time] = {}
+    e.risk_tm[e.stage_time] = {}
+    e.trials_tm[e.stage_time] = {}
+    e.risk_se_tm[e.stage_time] = {}
+    e.ess_tm[e.stage_time] = {}
+    vote_store.build_audited_vote_store(e, e.av_cpb)
+    audit.draw_sample(e)
+    return e
+
+
+def set_engine(e, engine):
+    """ Make every measurement of e use the given engine. """
+
+    for mid in e.mids:
+        if engine == "analytic":
+            e.risk_method_m[mid] = "Analytic"
+            e.risk_measurement_parameters_m[mid] = ("", "")
+        else:
+            e.risk_method_m[mid] = "Bayes"
+            e.risk_measurement_parameters_m[mid] = (engine, "")
+
+
+def count_selections(e):
+    """
+    Return largest number of selections (not counting error selections
+    such as "-Invalid") of any contest of e.
+    """
+
+    return max(len([selid for selid in e.selids_c[cid]
+                    if not ids.is_error_selid(selid)])
+               for cid in e.cids)
+
+
+def count_strata(e):
+    """ Return total number of (cid, pbcid, rv) strata in the sample. """
+
+    sn_cpra = e.sn_tcpra[e.stage_time]
+    return sum(len(sn_cpra[cid][pbcid])
+               for cid in sn_cpra
+               for pbcid in sn_cpra[cid])
+
+
+##############################################################################
+# Timing
+
+def time_risks(e, engine, trials):
+    """
+    Return list of (function name, seconds, risk) triples, timing
+    compute_risk for the first measurement and compute_risks for all
+    of them, with the given engine and number of trials.  The risk
+    given is that of the first measurement.
+    """
+
+    set_engine(e, engine)
+    mid = e.mids[0]
+    timings = []
+
+    start = time.perf_counter()
+    risk_bayes.compute_risk(e, mid, e.sn_tcpra, trials)
+    timings.append(("compute_risk",
+                    time.perf_counter() - start,
+                    e.risk_tm[e.stage_time][mid]))
+
+    start = time.perf_counter()
+    risk_bayes.compute_risks(e, e.sn_tcpra, trials)
+    timings.append(("compute_risks",
+                    time.perf_counter() - start,
+                    e.risk_tm[e.stage_time][mid]))
+    return timings
+
+
+def benchmark_configs(quick=False):
+    """
+    Return list of (spec name, n_contests, n_collections, n_selections,
+    n_ballots) configurations to benchmark: the syn2 specs (with None for
+    the counts), then synthetic specs varying one parameter at a time
+    from a base configuration.
+    """
+
+    configs = [(name, None, None, None, None) for name in syn2_spec_names()]
+    base = (2, 5, 3, 2000)
+    if quick:
+        sweeps = [[1, 5], [1, 5], [2, 5], [500, 2000]]
+    else:
+        sweeps = [[1, 5, 20], [1, 5, 20, 50], [2, 3, 5, 10], [500, 2000, 20000]]
+    seen = set()
+    for (i, values) in enumerate(sweeps):
+        for value in values:
+            params = base[:i] + (value,) + base[i+1:]
+            if params not in seen:
+                seen.add(params)
+                configs.append(("synthetic",) + params)
+    return configs
+
+
+def run_benchmarks(configs, engines, trials_list, sample_size, filename,
+                   seed=1):
+    """
+    Time risk computations for each configuration, engine, and number
+    of trials, writing one CSV row per timing to filename.
+    """
+
+    fieldnames = ["Spec", "Contests", "Collections", "Selections",
+                  "Ballots", "Strata", "Engine", "Trials", "Function",
+                  "Seconds", "Risk"]
+    with open(filename, "w") as file:
+        file.write(",".join(fieldnames))
+        file.write("\n")
+        for (spec, n_contests, n_collections, n_selections, n_ballots) \
+                in configs:
+            if spec == "synthetic":
+                L = synthetic_spec(n_contests, n_collections, n_selections,
+                                   n_ballots)
+            else:
+                L = read_syn2_spec(spec)
+            e = build_election(L, sample_size, seed)
+            n_strata = count_strata(e)
+            for engine in engines:
+                for trials in trials_list:
+                    for (function, seconds, risk) in \
+                            time_risks(e, engine, trials):
+                        row = [spec,
+                               len(e.cids),
+                               len(e.pbcids),
+                               count_selections(e),
+                               sum(len(e.bids_p[pbcid])
+                                   for pbcid in e.pbcids),
+                               n_strata,
+                               engine,
+                               trials,
+                               function,
+                               "{:.6f}".format(seconds),
+                               risk]
+                        file.write(",".join(str(x) for x in row))
+                        file.write("\n")
+                        file.flush()
+                        print("{:10s} contests={} collections={} "
+                              "selections={} engine={:10s} trials={:7d} "
+                              "{:13s} {:9.4f}s risk={}"
+                              .format(spec, row[1], row[2], row[3],
+                                      engine, trials, function,
+                                      seconds, risk))
+
+
+##############################################################################
+# Command-line arguments
+
+def parse_args():
+
+    parser = argparse.ArgumentParser(description=\
+                                     ("benchmark.py: "
+                                      "Times the risk computations of "
+                                      "multi.py on syn2 specs and on "
+                                      "synthetic elections of various sizes."))
+
+    parser.add_argument("--quick",
+                        action="store_true",
+                        help="Run a smaller set of configurations.")
+
+    parser.add_argument("--engines",
+                        help=("Comma-separated list of risk engines to time "
+                              "(default: {}).".format(",".join(BENCHMARK_ENGINES))),
+                        default=",".join(BENCHMARK_ENGINES))
+
+    parser.add_argument("--trials",
+                        help="Comma-separated list of numbers of trials.",
+                        default="1000,10000")
+
+    parser.add_argument("--sample_size",
+                        help="Number of ballots sampled from each collection.",
+                        type=int,
+                        default=200)
+
+    parser.add_argument("--seed",
+                        help="Audit seed (and seed for shuffling votes).",
+                        type=int,
+                        default=1)
+
+    parser.add_argument("--output",
+                        help=("CSV file to write results to (default "
+                              "benchmark-DATETIME.csv)."))
+
+    parser.add_argument("--elections_root",
+                        help=("The directory where syn2_specs is to be found.  "
+                              "Defaults to './elections'."),
+                        default="./elections")
+
+    return parser.parse_args()
+
+
+def main():
+
+    args = parse_args()
+    multi.ELECTIONS_ROOT = args.elections_root
+    engines = [engine.strip() for engine in args.engines.split(",")]
+    trials_list = [int(trials) for trials in args.trials.split(",")]
+    filename = args.output
+    if filename == None:
+        filename = "benchmark-{}.csv".format(utils.datetime_string())
+    run_benchmarks(benchmark_configs(args.quick), engines, trials_list,
+                   args.sample_size, filename, args.seed)
+    print("Results written to", filename)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,10 +12,11 @@ import argparse
 
 
 import multi
+import election_cache
 import election_spec
 import ids
 import audit
-import reported
+import risk_bayes
 
 
 ##############################################################################
@@ -68,6 +69,57 @@ def parse_args():
                         action="store_true",
                         help="Run audit based on current info.")
 
+    parser.add_argument("--workers",
+                        type=int,
+                        help=("Number of worker processes for computing risks "
+                              "in parallel.  If given (even as 1), each "
+                              "measurement uses its own random stream derived "
+                              "from the audit seed, so results do not depend "
+                              "on the number of workers."))
+
+    parser.add_argument("--risk_memory_mb",
+                        type=float,
+                        help=("Memory budget, in megabytes, for the trial "
+                              "matrices of the vectorized risk engine.  If "
+                              "given, trials are simulated in chunks that fit "
+                              "the budget; results don't depend on the budget, "
+                              "or on whether one is given."))
+
+    parser.add_argument("--risk_float32",
+                        action="store_true",
+                        help=("Accumulate the vectorized risk engine's "
+                              "simulated tallies in float32 to save memory."))
+
+    parser.add_argument("--risk_progress",
+                        action="store_true",
+                        help=("Print the running risk estimate, its confidence "
+                              "interval, and the trials done while the adaptive "
+                              "risk engine runs (only that engine, and only "
+                              "with at most one worker, reports progress).  "
+                              "Interrupting (Ctrl-C) an adaptive risk "
+                              "computation keeps the estimate so far."))
+
+    parser.add_argument("--incremental",
+                        action="store_true",
+                        help=("In each audit stage, only recompute the risks "
+                              "of measurements that are still Open and whose "
+                              "sample tallies have changed since the previous "
+                              "stage; carry the other risks forward."))
+
+    parser.add_argument("--risk_cache",
+                        action="store_true",
+                        help=("Keep computed risks in a cache file in "
+                              "3-audit/34-audit-output, and reuse them when "
+                              "a measurement's sample tallies, seed, and other "
+                              "inputs are unchanged (as when re-running a stage)."))
+
+    parser.add_argument("--no_election_cache",
+                        action="store_true",
+                        help=("Always reparse the election spec and reported "
+                              "data, rather than loading them from the cache "
+                              "file in 3-audit/34-audit-output when no input "
+                              "file has changed (see election_cache.py)."))
+
     args = parser.parse_args()
     # print("Command line arguments:", args)
     return args
@@ -84,14 +136,34 @@ def process_args(e, args):
     if args.set_audit_seed != None:
         audit.set_audit_seed(e, args.set_audit_seed)
 
+    if args.workers != None:
+        e.n_workers = args.workers
+
+    if args.risk_memory_mb != None:
+        e.risk_memory_budget = int(args.risk_memory_mb * 2**20)
+
+    if args.risk_float32:
+        e.risk_float32 = True
+
+    if args.risk_progress:
+        e.risk_progress_callback = risk_bayes.print_risk_progress
+
+    if args.incremental:
+        e.incremental = True
+
+    if args.risk_cache:
+        e.use_risk_cache = True
+
+    if args.no_election_cache:
+        e.use_election_cache = False
+
     if args.read_election_spec:
         print("read_election_spec")
         election_spec.read_election_spec(e)
 
     elif args.read_reported:
         print("read_reported")
-        election_spec.read_election_spec(e)
-        reported.read_reported(e)
+        election_cache.read_election(e)
 
     elif args.make_audit_orders:
         print("make_audit_orders")
@@ -101,8 +173,7 @@ def process_args(e, args):
         print("read_audited--NO-OP-TBD")
 
     elif args.audit:
-        election_spec.read_election_spec(e)
-        reported.read_reported(e)
+        election_cache.read_election(e)
         audit.audit(e, args)
 
 
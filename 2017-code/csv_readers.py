@@ -18,7 +18,8 @@ different: the last header may correspond to 0, 1, 2, or more valuesin a data ro
 So the data row may be shorter (by one), equal to, or longer than the header row.
 In any case, the values for the last field are *always* compiled into a tuple
 (possibly an empty tuple).
-The reader returns a list of dictionaries, one per row.
+The reader returns a list of dictionaries, one per row (or, for
+iter_csv_file, yields them one at a time).
 Example (regular csv file):
     A,B,C
     1,2,3
@@ -48,25 +49,47 @@ import utils
 def read_csv_file(filename, required_fieldnames=None, varlen=False):
     """
     Read CSV file and check required fieldnames present; varlen if variable-length rows.
+    Return list of row dicts (see iter_csv_file).
+    """
+
+    return list(iter_csv_file(filename, required_fieldnames, varlen))
+
+
+def iter_csv_file(filename, required_fieldnames=None, varlen=False):
+    """
+    Like read_csv_file, but a generator yielding the cleaned row dicts one
+    at a time, as the file is read, so that only the current row is held
+    in memory.  The header is read and checked before any row is yielded.
     """
 
     # print("Reading CSV file:", filename)
     with open(filename) as file:
         reader = csv.reader(file)
-        rows = [row for row in reader]
-        fieldnames = rows[0]
-        rows = rows[1:]
+        fieldnames = next(reader, [])
         
         # gather, clean, and trim field names, eliminating blanks
         fieldnames = [ids.clean_id(fieldname) for fieldname in fieldnames]
         while len(fieldnames)>0 and fieldnames[-1]=='':
             fieldnames.pop()
         if len(set(fieldnames)) != len(fieldnames):
-            utils.myerror("Duplicate field name:"+fieldnames)
+            utils.myerror("Duplicate field name:"+str(fieldnames))
+
+        if required_fieldnames != None:
+            # check that all required fieldnames are present
+            required_fieldnames = [ids.clean_id(id) for id in required_fieldnames]
+            missing_fieldnames = set(required_fieldnames).difference(set(fieldnames))
+            if len(missing_fieldnames) > 0:
+                utils.myerror("File {} has fieldnames {}, while {} are required. Missing {}."
+                              .format(filename, fieldnames,
+                                      required_fieldnames, missing_fieldnames))
+            # check to see if extra fieldnames present; warn user if so
+            extra_fieldnames = set(fieldnames).difference(set(required_fieldnames))
+            if len(extra_fieldnames) > 0:
+                utils.mywarning("File {} has extra fieldnames (ignored): {}"
+                                .format(filename, extra_fieldnames))
 
         # data rows
-        row_dicts = []
-        for row in rows:
+        for row in reader:
             row = ["" if item==None else ids.clean_id(item) for item in row]
             while len(row)>0 and row[-1] == '':
                 row.pop()
@@ -87,21 +110,7 @@ def read_csv_file(filename, required_fieldnames=None, varlen=False):
                 last_fieldname = fieldnames[-1]
                 last_value = tuple(row[len(fieldnames)-1:])
                 row_dict[last_fieldname] = last_value
-            row_dicts.append(row_dict)
-        if required_fieldnames != None:
-            # check that all required fieldnames are present
-            required_fieldnames = [ids.clean_id(id) for id in required_fieldnames]
-            missing_fieldnames = set(required_fieldnames).difference(set(fieldnames))
-            if len(missing_fieldnames) > 0:
-                utils.myerror("File {} has fieldnames {}, while {} are required. Missing {}."
-                              .format(filename, fieldnames,
-                                      required_fieldnames, missing_fieldnames))
-            # check to see if extra fieldnames present; warn user if so
-            extra_fieldnames = set(fieldnames).difference(set(required_fieldnames))
-            if len(extra_fieldnames) > 0:
-                utils.mywarning("File {} has extra fieldnames (ignored): {}"
-                                .format(filename, extra_fieldnames))
-        return row_dicts
+            yield row_dict
 
 
 if __name__=="__main__":
@@ -0,0 +1,170 @@
+# election_cache.py
+# python3
+
+"""
+Cache of the parsed election spec and reported data.
+
+Reading an election (election_spec.read_election_spec followed by
+reported.read_reported) parses every file in 1-election-spec and
+2-reported, and then computes the derived data (symbol tables, vote
+store, reported counts).  For a large election this dominates the
+running time of each invocation of multi.py.
+
+read_election therefore saves the resulting state of the Election
+(all attributes except those set from the command line) as a pickle
+file
+
+    3-audit/34-audit-output/audit-output-election-cache.pickle
+
+together with a key: the SHA256 hash of the names and hashes (see
+snapshot.hash_file) of all files in 1-election-spec and 2-reported,
+and of the source files of the modules that read them.  A later run
+whose key matches loads the state from the cache instead of reparsing;
+any change to an input file (or to the reading code) changes the key,
+and the election is read afresh and the cache rewritten.
+
+The output printed while reading is saved with the state, and printed
+again when the state is loaded from the cache.  The cache is only
+written when reading gave no warnings, so that warnings are repeated
+on each run until fixed.  Like any pickle file, the cache file should
+only be loaded if it was written by a trusted run of multi.py.
+"""
+
+import hashlib
+import io
+import json
+import os
+import pickle
+
+import multi
+import csv_readers
+import election_spec
+import groups
+import ids
+import manifest
+import outcomes
+import reported
+import snapshot
+import symbols
+import utils
+import vote_store
+
+# Changed whenever the layout of the cached state changes.
+ELECTION_CACHE_VERSION = 1
+
+# Modules whose code determines the state read; their source files are
+# part of the cache key.
+READER_MODULES = [multi, csv_readers, election_spec, groups, ids, manifest,
+                  outcomes, reported, symbols, utils, vote_store]
+
+# Attributes of an Election set from the command line (see cli.py)
+# rather than by reading the election; not saved in the cache.
+COMMAND_LINE_ATTRIBUTES = ["election_dirname",
+                           "audit_seed",
+                           "risk_progress_callback",
+                           "incremental",
+                           "use_risk_cache",
+                           "use_election_cache",
+                           "risk_memory_budget",
+                           "risk_float32",
+                           "n_workers"]
+
+
+def read_election(e):
+    """
+    Read election spec and reported data into e, from the election
+    cache if it is up to date (and e.use_election_cache is True).
+    """
+
+    if e.use_election_cache:
+        key = election_cache_key(e)
+        cache = read_election_cache(e, key)
+        if cache != None:
+            vars(e).update(cache["state"])
+            utils.myprint(cache["output"], end="")
+            return
+
+    warnings_given = utils.warnings_given
+    output = io.StringIO()
+    utils.myprint_files["election_cache"] = output
+    try:
+        election_spec.read_election_spec(e)
+        reported.read_reported(e)
+    finally:
+        del utils.myprint_files["election_cache"]
+    if e.use_election_cache and utils.warnings_given == warnings_given:
+        write_election_cache(e, key, output.getvalue())
+
+
+def election_cache_pathname(e):
+    """ Return pathname of election cache file for election e. """
+
+    dirpath = os.path.join(multi.ELECTIONS_ROOT,
+                           e.election_dirname,
+                           "3-audit",
+                           "34-audit-output")
+    return os.path.join(dirpath, "audit-output-election-cache.pickle")
+
+
+def election_cache_key(e):
+    """
+    Return key (a SHA256 hex digest) for the election cache of e,
+    covering the files in 1-election-spec and 2-reported and the
+    source files of READER_MODULES.
+    """
+
+    election_pathname = os.path.join(multi.ELECTIONS_ROOT, e.election_dirname)
+    file_hashes = {}
+    for dirname in ["1-election-spec", "2-reported"]:
+        dir_hash = snapshot.compute_dir_hash(os.path.join(election_pathname,
+                                                          dirname))
+        for (filename, hashvalue) in dir_hash.items():
+            file_hashes[os.path.relpath(filename, election_pathname)] = hashvalue
+    module_hashes = {module.__name__: snapshot.hash_file(module.__file__)
+                     for module in READER_MODULES}
+    inputs = {"version": ELECTION_CACHE_VERSION,
+              "election_dirname": e.election_dirname,
+              "files": file_hashes,
+              "modules": module_hashes}
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def read_election_cache(e, key):
+    """
+    Return the cache (a dict giving the saved "state" and "output")
+    read from the election cache file if it was saved under the given
+    key, else None.
+    """
+
+    pathname = election_cache_pathname(e)
+    if not os.path.exists(pathname):
+        return None
+    try:
+        with open(pathname, "rb") as file:
+            cache = pickle.load(file)
+    except Exception:
+        # not a warning (which would stop the election spec checks)
+        utils.myprint("Ignoring unreadable election cache file `{}`."
+                      .format(pathname))
+        return None
+    if not isinstance(cache, dict) or cache.get("key") != key:
+        return None
+    return cache
+
+
+def write_election_cache(e, key, output):
+    """
+    Write the state of e (less COMMAND_LINE_ATTRIBUTES), and the output
+    printed while reading it, to the election cache file under the given
+    key.  The file is replaced atomically, so a crash can't leave a
+    partly-written cache.
+    """
+
+    state = {attribute: value for (attribute, value) in vars(e).items()
+             if attribute not in COMMAND_LINE_ATTRIBUTES}
+    pathname = election_cache_pathname(e)
+    os.makedirs(os.path.dirname(pathname), exist_ok=True)
+    with open(pathname + ".tmp", "wb") as file:
+        pickle.dump({"key": key, "state": state, "output": output}, file,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(pathname + ".tmp", pathname)
@@ -13,26 +13,41 @@ These routines all related to ids:
     measurement ids (mids)
 """
 
+import functools
+
 ##############################################################################
 ## generic id-related routines
 
 
+# Number of distinct ids whose cleaned form is remembered by clean_id.
+CLEAN_ID_CACHE_SIZE = 2**16
+
+
+@functools.lru_cache(maxsize=CLEAN_ID_CACHE_SIZE)
 def clean_id(id):
     """
     Return id with initial and final whitespace removed, and
     with any internal whitespace sequences replaced by a single
     blank.  Also, all nonprintable characters are removed.
+
+    Since the same ids occur over and over in the CSV files, results
+    are cached (for the CLEAN_ID_CACHE_SIZE most recently used ids),
+    so a repeated id costs a lookup, and its cleaned copies are all
+    the same string object.
     """
 
+    if id.isprintable():
+        # only whitespace is " " (tabs, newlines, etc. aren't printable)
+        return " ".join(id.split())
     id = id.strip()
-    new_id = ""
+    new_id = []
     for c in id:
         if c.isspace():
             c = " "
         if (c != " " or (len(new_id)>0 and new_id[-1] != " ")) \
            and c.isprintable():
-            new_id += c
-    return new_id
+            new_id.append(c)
+    return "".join(new_id)
 
 
 def filename_safe(id):
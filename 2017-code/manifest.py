@@ -0,0 +1,244 @@
+# manifest.py
+# python3
+
+"""
+Run-length representation of the ballot manifest of a paper ballot
+collection.
+
+A row of a ballot manifest file with "Number of ballots" equal to n
+describes n ballots, whose ballot ids, positions, and stamps count on
+from those given in the row (see utils.count_on), and which share the
+row's other fields.  A Manifest keeps the rows as such runs, rather
+than expanding them into one record per ballot, and answers
+
+    manifest[i]              the ballot id of the i-th ballot
+    manifest.index(bid)      the index of the ballot with id bid
+
+in time logarithmic in the number of rows.  A Manifest is a sequence
+of ballot ids, and is what reported.read_reported_ballot_manifests
+stores as e.bids_p[pbcid]; the per-ballot fields e.boxid_pb[pbcid],
+e.position_pb[pbcid], and so on are ManifestField views of it.  Since
+ballot ids are (normally) distinct, a Manifest also serves as the
+symbol table e.bid_symbols_p[pbcid] (see symbols.py), coding each bid
+by its index.
+"""
+
+import bisect
+import collections.abc
+import numpy as np
+
+import utils
+
+# Fields of a manifest row whose values count on along the run of ballots;
+# other fields are the same for all ballots of the run.
+COUNTED_FIELDNAMES = ["Ballot id", "Position", "Stamp"]
+
+MANIFEST_FIELDNAMES = ["Ballot id", "Box", "Position", "Stamp",
+                       "Required Contests", "Possible Contests", "Comments"]
+
+
+class Manifest(collections.abc.Sequence):
+    """
+    The ballot ids of a collection, kept as the runs given by the rows
+    of its ballot manifest (see above).
+    """
+
+    def __init__(self):
+
+        self.rows = []          # row dicts (MANIFEST_FIELDNAMES) of the runs
+        self.nums = []          # number of ballots in each run
+        self.ends = []          # index just past the last ballot of each run
+        self.lookup = None      # index for finding bids (see make_lookup)
+
+    def add_row(self, row, num):
+        """
+        Add run of num ballots described by row (a dict with keys
+        MANIFEST_FIELDNAMES, as read from the manifest file).
+        """
+
+        self.rows.append({fieldname: row[fieldname]
+                          for fieldname in MANIFEST_FIELDNAMES})
+        self.nums.append(num)
+        self.ends.append(len(self) + num)
+        self.lookup = None
+
+    def __len__(self):
+
+        return self.ends[-1] if len(self.ends) > 0 else 0
+
+    def locate(self, i):
+        """ Return pair (run, offset within run) for ballot with index i. """
+
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("manifest index out of range")
+        run = bisect.bisect_right(self.ends, i)
+        return (run, i - (self.ends[run] - self.nums[run]))
+
+    def value(self, i, fieldname):
+        """ Return value of given field for ballot with index i. """
+
+        (run, offset) = self.locate(i)
+        value = self.rows[run][fieldname]
+        if fieldname in COUNTED_FIELDNAMES:
+            value = utils.count_on_item(value, self.nums[run], offset)
+        return value
+
+    def __getitem__(self, i):
+
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self.value(i, "Ballot id")
+
+    def __iter__(self):
+
+        for (row, num) in zip(self.rows, self.nums):
+            yield from utils.count_on(row["Ballot id"], num)
+
+    def make_lookup(self):
+        """
+        Build index for finding bids: a dict mapping the bids of
+        single-ballot runs to their (first) indices, and for each bid
+        prefix (see utils.count_on_parse) a list of the runs of more
+        than one ballot with that prefix, sorted by their first counter
+        value.  The latter are searched by bisection if they don't
+        overlap, and one by one otherwise.
+        """
+
+        singles = {}
+        runs_by_prefix = {}
+        for (run, (row, num)) in enumerate(zip(self.rows, self.nums)):
+            bid = row["Ballot id"]
+            if num == 1:
+                singles.setdefault(bid, self.ends[run] - 1)
+            elif num > 1:
+                (prefix, counter, width) = utils.count_on_parse(bid)
+                runs_by_prefix.setdefault(prefix, []).append((counter, run))
+        ranges = {}
+        for (prefix, runs) in runs_by_prefix.items():
+            runs.sort()
+            overlapping = any(runs[k+1][0] < runs[k][0] + self.nums[runs[k][1]]
+                              for k in range(len(runs)-1))
+            ranges[prefix] = ([counter for (counter, run) in runs],
+                              [run for (counter, run) in runs],
+                              overlapping)
+        self.lookup = (singles, ranges)
+
+    def get(self, bid, default=None):
+        """ Return index of (first) ballot with id bid, or default if none. """
+
+        if self.lookup == None:
+            self.make_lookup()
+        singles = self.lookup[0]
+        indices = self.run_indices(bid)
+        if bid in singles:
+            indices.append(singles[bid])
+        return min(indices) if len(indices) > 0 else default
+
+    def run_indices(self, bid):
+        """
+        Return list of indices of ballots with id bid within runs of more
+        than one ballot (see make_lookup, which must have been called).
+        """
+
+        ranges = self.lookup[1]
+        indices = []
+        if isinstance(bid, str):
+            (prefix, number, width) = utils.count_on_parse(bid)
+            if prefix in ranges and bid != prefix:
+                (counters, runs, overlapping) = ranges[prefix]
+                if overlapping:
+                    candidates = range(len(runs))
+                else:
+                    candidates = [bisect.bisect_right(counters, number) - 1]
+                for k in candidates:
+                    if k < 0:
+                        continue
+                    (run, offset) = (runs[k], number - counters[k])
+                    if 0 <= offset < self.nums[run] and \
+                       utils.count_on_item(self.rows[run]["Ballot id"],
+                                           self.nums[run], offset) == bid:
+                        indices.append(self.ends[run] - self.nums[run] + offset)
+        return indices
+
+    def index(self, bid):
+
+        i = self.get(bid)
+        if i == None:
+            raise ValueError("{} is not in manifest".format(bid))
+        return i
+
+    def __contains__(self, bid):
+
+        return self.get(bid) != None
+
+    def distinct(self):
+        """
+        Return True if no two ballots have the same ballot id.  (To be
+        quick, runs with the same prefix and overlapping counter values
+        are taken as having a common ballot id, even if they differ in
+        the number of digits.)
+        """
+
+        if self.lookup == None:
+            self.make_lookup()
+        (singles, ranges) = self.lookup
+        if sum(1 for num in self.nums if num == 1) != len(singles):
+            return False
+        if any(overlapping for (_, _, overlapping) in ranges.values()):
+            return False
+        return all(len(self.run_indices(bid)) == 0 for bid in singles)
+
+    # Symbol-table interface (see symbols.SymbolTable): the code of a bid
+    # is its index.
+
+    def code(self, bid):
+
+        return self.index(bid)
+
+    def symbol(self, code):
+
+        return self[code]
+
+    def encode(self, bids, default=-1):
+
+        return np.fromiter((self.get(bid, default) for bid in bids),
+                           dtype=np.int64)
+
+    def decode(self, codes):
+
+        return [self[code] for code in codes]
+
+    def field(self, fieldname):
+        """ Return ManifestField view of the given field. """
+
+        return ManifestField(self, fieldname)
+
+
+class ManifestField(collections.abc.Mapping):
+    """
+    Read-only mapping from the ballot ids of a Manifest to the values
+    of one of their fields (such as "Box" or "Position"), computed from
+    the runs as needed.
+    """
+
+    def __init__(self, manifest, fieldname):
+
+        self.manifest = manifest
+        self.fieldname = fieldname
+
+    def __getitem__(self, bid):
+
+        i = self.manifest.get(bid)
+        if i == None:
+            raise KeyError(bid)
+        return self.manifest.value(i, self.fieldname)
+
+    def __iter__(self):
+
+        return iter(self.manifest)
+
+    def __len__(self):
+
+        return len(self.manifest)
@@ -252,10 +252,12 @@ class Election(object):
         e.bids_p = {}
         # input (21-reported-ballot-manifests/reported-ballot-manifest-PBCID.csv)
         # pbcid->[bids]
-        # e.bids_p[pbcid] is list of ballot ids (bids) in that pbcid
+        # e.bids_p[pbcid] is sequence of ballot ids (bids) in that pbcid
         # from ballot manifest "Ballot id" column (as expanded for batches)
         # order is preserved from ballot manifest file.
-        # No need for "Number of ballots" field (always implicitly 1 now).
+        # When read from a manifest file this is a manifest.Manifest, which
+        # keeps the rows with "Number of ballots">1 as runs rather than
+        # expanding them; synthetic elections may use plain lists.
 
         e.boxid_pb = {}
         # input (21-reported-ballot-manifests/reported-ballot-manifest-PBCIDcsv)
@@ -273,9 +275,11 @@ class Election(object):
         # from ballot manifest "Stamp" field (same as "imprint")
 
         # Note that the "Number of ballots" field of a ballot manifest
-        # is not captured here; we assume that any rows in an input
-        # manifest with "Number of ballots">1 is expanded into multiple rows
-        # first.
+        # is not captured here; e.boxid_pb[pbcid], e.position_pb[pbcid],
+        # e.stamp_pb[pbcid], e.required_gid_pb[pbcid], e.possible_gid_pb[pbcid],
+        # and e.comments_pb[pbcid] are mappings from bids (for a Manifest,
+        # manifest.ManifestField views computing each ballot's value from
+        # its run), as if rows with "Number of ballots">1 were expanded.
 
         e.required_gid_pb = {}
         e.possible_gid_pb = {}
@@ -301,6 +305,7 @@ class Election(object):
         # cid->pbcid->bid->vote
         # vote in given contest, paper ballot collection, and ballot id
         # e.rv_cpb is like e.av, but reported votes instead of actual votes
+        # (emptied by reported.read_reported once e.rv_code_cp is built)
 
         e.votes_c = {}
         # input (from selids_c, reported votes, and actual otes)
@@ -312,6 +317,20 @@ class Election(object):
 
         # Computed from the above
 
+        e.bid_symbols_p = {}
+        e.vote_symbols_c = {}
+        # Computed from e.pbcids, e.bids_p, and e.votes_c
+        # (see symbols.build_symbol_tables)
+        # dense integer codes for ballot ids (per pbcid) and votes
+        # (per cid), used by loops over ballots
+
+        e.rv_code_cp = {}
+        e.rv_present_cp = {}
+        # Computed from e.rv_cpb (see vote_store.py)
+        # cid->pbcid->numpy array, aligned with e.bids_p[pbcid]
+        # columnar store of reported votes: vote codes (in
+        # e.vote_symbols_c[cid]), and mask of ballots having a vote for cid
+
         e.rn_cpr = {}
         # Computed from e.rv_cpb
         # cid->pbcid->rvote->count
@@ -362,9 +381,10 @@ class Election(object):
 
         e.risk_method_m = {}
         # input (31-audit-spec/audit-spec-contest.csv)
-        # mid->{"Bayes", "Frequentist"}
+        # mid->{"Bayes", "Analytic", "Frequentist"}
         # The risk-measurement method used for a given measurement.
-        # Right now, the options are "Bayes" and "Frequentist", but this may
+        # Right now, the options are "Bayes", "Analytic" (normal
+        # approximation to the Bayes risk), and "Frequentist", but this may
         # change.
         # dict mapping mids to strings
 
@@ -424,6 +444,71 @@ class Election(object):
 
         e.n_trials = 100000
         # number of trials used to estimate risk in compute_contest_risk
+        # (the maximum number, for the "adaptive" risk engine)
+
+        e.risk_chunk_trials = 1000
+        # number of trials run between checks of the stopping rule
+        # by the "adaptive" risk engine
+
+        e.risk_confidence = 0.99
+        # default confidence level with which the "adaptive" risk engine
+        # must know the status of a measurement before stopping
+        # (may be overridden per measurement by "Param 2")
+
+        e.risk_progress_callback = None
+        # input (command line)
+        # if not None, function called as risk_progress_callback(e, progress)
+        # after each chunk of trials run by the "adaptive" risk engine,
+        # with progress a risk_bayes.RiskProgress giving the running estimate
+        # (risk_bayes.print_risk_progress prints it)
+
+        e.interrupted_mids = set()
+        # measurements whose risk computation (by the "adaptive" engine)
+        # was interrupted in the last call to risk_bayes.compute_risks;
+        # their risks are estimates from the trials run before the interrupt,
+        # so they stay Open (see audit.compute_statuses)
+
+        e.analytic_min_stratum_size = 1000
+        # strata with fewer unsampled ballots than this are "small" for
+        # the "Analytic" risk method, which falls back to simulation when
+        # small strata hold a noticeable share of a contest's ballots
+
+        e.incremental = False
+        # input (command line)
+        # if True, a stage only recomputes the risks of measurements that
+        # are still Open and whose sample tallies have changed since the
+        # previous stage; other risks are carried forward
+
+        e.use_risk_cache = False
+        # input (command line)
+        # if True, risks whose inputs are unchanged are read from
+        # (and new ones written to) the risk cache file in
+        # 3-audit/34-audit-output, rather than recomputed
+
+        e.use_election_cache = True
+        # input (command line)
+        # if True, the election spec and reported data are loaded from
+        # the election cache file in 3-audit/34-audit-output when none
+        # of their files has changed, rather than reparsed (see
+        # election_cache.py)
+
+        e.risk_memory_budget = None
+        # input (command line)
+        # if not None, the "vectorized" risk engine simulates trials in
+        # chunks whose trial matrices take at most about this many bytes
+        # (see risk_bayes.count_wrong_outcomes_chunked)
+
+        e.risk_float32 = False
+        # input (command line)
+        # if True, the "vectorized" engine accumulates test tallies
+        # in float32 rather than float64
+
+        e.n_workers = None
+        # input (command line)
+        # number of worker processes used to compute risks in parallel.
+        # If None, risks are computed serially from the single global
+        # audit random state; otherwise each measurement gets its own
+        # random stream (see risk_bayes.measurement_random_state).
 
         e.shuffled_indices_p = {}
         e.shuffled_bids_p = {}
@@ -464,6 +549,29 @@ class Election(object):
         # risk = probability that e.ro_c[e.cid[mid]] is wrong
         # dict mapping stage_time and mid to floats
 
+        e.trials_tm = {}
+        # stage_time->measurement->int
+        # number of trials actually run to estimate e.risk_tm
+        # dict mapping stage_time and mid to ints
+
+        e.risk_se_tm = {}
+        # stage_time->measurement->reals
+        # standard error of the estimate e.risk_tm (zero when the risk
+        # was computed numerically rather than by trials)
+        # dict mapping stage_time and mid to floats
+
+        e.ess_tm = {}
+        # stage_time->measurement->reals
+        # effective sample size of the trials behind e.risk_tm: the
+        # number of trials, except for importance sampling, where
+        # weighted trials are worth fewer plain ones
+        # dict mapping stage_time and mid to floats
+
+        e.timings_t = {}
+        # stage_time->list of timing records (dicts), giving wall and CPU
+        # time (and counts of trials, strata, rows) for each phase of
+        # the stage and each group of measurements; see timings.py
+
         e.election_status_t = {}
         # stage_time->list of measurement statuses, at most once each
         # dict mapping stage_time to string
@@ -476,7 +584,13 @@ class Election(object):
 
         e.av_cpb = {}
         # cid->pbcid->bid->vote
-        # (actual votes from sampled ballots)
+        # (actual votes from sampled ballots, as made by the synthetic
+        # election generators; audit.read_audited_votes does not keep them)
+
+        e.av_code_cp = {}
+        e.av_present_cp = {}
+        # Computed in audit.read_audited_votes (see vote_store.py)
+        # columnar store of actual votes, like e.rv_code_cp and e.rv_present_cp
 
         # computed from the above sample data
 
@@ -488,6 +602,12 @@ class Election(object):
         # sampled number stage_time->cid->pbcid->vote->count
         # sampled number by stage_time, contest, pbcid, and reported vote
 
+        e.sn_digest_tcp = {}
+        # stage_time->cid->pbcid->string
+        # SHA256 hex digest of e.sn_tcpra[stage_time][cid][pbcid], saved
+        # (with e.risk_tm) so that an incremental stage can tell which
+        # sample tallies have changed since the previous stage
+
         # *** saved-state ***
         # see saved-state.py
         e.saved_state = {}
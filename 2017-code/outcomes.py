@@ -14,7 +14,10 @@ An outcome is always a *tuple* of ids, even if there is only one winner.
 # TBD: Tie-breaking, etc.
 
 
+import numpy as np
+
 import ids
+import utils
 
 
 def compute_tally(vec):
@@ -77,6 +80,73 @@ def compute_outcome(e, cid, tally):
                       .format(e.contest_type_c[cid], cid))
 
 
+##############################################################################
+# Batch outcome evaluation (for Monte Carlo tally matrices)
+#
+# Here votes is a list of the votes of a contest, in a fixed order, and a
+# "tally matrix" is a 2-d numpy array with one row per trial and one column
+# per vote, in the order of votes.  Outcomes are encoded as column indices
+# into votes.
+
+NO_WINNER = -1         # winner index when no vote may win
+NOT_A_VOTE = -2        # encoding for an outcome that is not one of votes
+
+
+def can_win_mask(e, cid, votes):
+    """
+    Return boolean numpy array, parallel to votes, that is True
+    exactly for those votes that may win contest cid.
+    For plurality, an undervote, an overvote, or an error vote
+    (e.g. ("-Invalid",) or ("-NoSuchContest",)) can't win.
+    """
+
+    return np.array([len(vote) == 1 and not ids.is_error_selid(vote[0])
+                     for vote in votes], dtype=bool)
+
+
+def encode_outcome(votes, outcome):
+    """ 
+    Return index of outcome in votes, or NOT_A_VOTE if it isn't there
+    (so that it never equals a winner index computed by plurality_batch).
+    """
+
+    for (i, vote) in enumerate(votes):
+        if vote == outcome:
+            return i
+    return NOT_A_VOTE
+
+
+def plurality_batch(e, cid, tallies, can_win):
+    """
+    Batch version of plurality.
+    Return int array giving, for each row of the tally matrix tallies,
+    the index of the vote with largest count among those votes for which
+    can_win is True (ties go to the lowest index), or NO_WINNER if no vote
+    can win.
+    """
+
+    winners = np.argmax(np.where(can_win, tallies, -np.inf), axis=1)
+    if not can_win.any():
+        winners[:] = NO_WINNER
+    return winners
+
+
+def compute_outcome_batch(e, cid, tallies, can_win):
+    """
+    Batch version of compute_outcome: return array of encoded
+    outcomes (winner indices), one per row of tally matrix tallies.
+    Here can_win is as computed by can_win_mask.
+    """
+
+    if e.contest_type_c[cid].lower()=="plurality":
+        return plurality_batch(e, cid, tallies, can_win)
+    else:
+        # TBD: IRV, etc...
+        utils.myerror(("Non-plurality outcome rule {} for contest {}"
+                       "not yet implemented!")
+                      .format(e.contest_type_c[cid], cid))
+
+
 def compute_tally2(vec):
     """
     Input vec is an iterable of (a, r) pairs. 
@@ -34,13 +34,18 @@ See associated file README for file formats.
 """
 
 
+import collections.abc
+import numpy as np
 import os
 
 
 import multi
 import csv_readers
 import ids
+import manifest
+import symbols
 import utils
+import vote_store
 
 
 ##############################################################################
@@ -55,13 +60,19 @@ def read_reported(e):
     read_reported_outcomes(e)
     
     finish_reported(e)
+    # the columnar vote store (see vote_store.py) now holds the reported votes
+    e.rv_cpb = {}
     check_reported(e)
     show_reported(e)
 
 
 def read_reported_ballot_manifests(e):
     """
-    Read ballot manifest file 21-reported-ballot-manifests and expand rows if needed.
+    Read ballot manifest file 21-reported-ballot-manifests.
+
+    The rows are kept as runs of ballots (see manifest.py), not expanded
+    into one entry per ballot: e.bids_p[pbcid] is a manifest.Manifest,
+    and e.boxid_pb[pbcid], e.position_pb[pbcid], etc. are views of it.
     """
 
     election_pathname = os.path.join(multi.ELECTIONS_ROOT, e.election_dirname)
@@ -77,38 +88,29 @@ def read_reported_ballot_manifests(e):
                                        "manifest-" + safe_pbcid,
                                        ".csv")
         file_pathname = os.path.join(specification_pathname, filename)
-        rows = csv_readers.read_csv_file(file_pathname, fieldnames, varlen=False)
-        for row in rows:
+        for row in csv_readers.iter_csv_file(file_pathname, fieldnames,
+                                             varlen=False):
             pbcid = row["Collection"]
-            boxid = row["Box"]
-            position = row["Position"]
-            stamp = row["Stamp"]
-            bid = row["Ballot id"]
             try:
                 num = int(row["Number of ballots"])
             except ValueError:
-                utils.myerror("Number {} of ballots not an integer.".format(num))
+                utils.myerror("Number {} of ballots not an integer."
+                              .format(row["Number of ballots"]))
             if num<=0:
                 utils.mywarning("Number {} of ballots not positive.".format(num))
-            req = row["Required Contests"]
-            poss = row["Possible Contests"]
-            comments = row["Comments"]
-
-            bids = utils.count_on(bid, num)
-            stamps = utils.count_on(stamp, num)
-            positions = utils.count_on(position, num)
-
-            for i in range(num):
-                # utils.nested_set(e.bids_p, [pbcid, bids[i]], True)
-                if pbcid not in e.bids_p:
-                    e.bids_p[pbcid] = []
-                e.bids_p[pbcid].append(bids[i])
-                utils.nested_set(e.boxid_pb, [pbcid, bids[i]], boxid)
-                utils.nested_set(e.position_pb, [pbcid, bids[i]], position[i])
-                utils.nested_set(e.stamp_pb, [pbcid, bids[i]], stamps[i])
-                utils.nested_set(e.required_gid_pb, [pbcid, bids[i]], req)
-                utils.nested_set(e.possible_gid_pb, [pbcid, bids[i]], poss)
-                utils.nested_set(e.comments_pb, [pbcid, bids[i]], comments)
+                continue
+            if pbcid not in e.bids_p:
+                e.bids_p[pbcid] = manifest.Manifest()
+            e.bids_p[pbcid].add_row(row, num)
+
+    for pbcid in e.bids_p:
+        ballot_manifest = e.bids_p[pbcid]
+        e.boxid_pb[pbcid] = ballot_manifest.field("Box")
+        e.position_pb[pbcid] = ballot_manifest.field("Position")
+        e.stamp_pb[pbcid] = ballot_manifest.field("Stamp")
+        e.required_gid_pb[pbcid] = ballot_manifest.field("Required Contests")
+        e.possible_gid_pb[pbcid] = ballot_manifest.field("Possible Contests")
+        e.comments_pb[pbcid] = ballot_manifest.field("Comments")
                           
 
 def read_reported_cvrs(e):
@@ -127,8 +129,8 @@ def read_reported_cvrs(e):
                                        "reported-cvrs-" + safe_pbcid,
                                        ".csv")
         file_pathname = os.path.join(specification_pathname, filename)
-        rows = csv_readers.read_csv_file(file_pathname, fieldnames, varlen=True)
-        for row in rows:
+        for row in csv_readers.iter_csv_file(file_pathname, fieldnames,
+                                             varlen=True):
             pbcid = row["Collection"]
             scanner = row["Scanner"]
             bid = row["Ballot id"]
@@ -160,68 +162,48 @@ def check_reported_selids(e):
     
     # make sure e.selids_c[cid] contains all +/- selids seen in reported votes
     # and that e.votes_c[cid] contains all reported votes
+    # (the distinct reported votes are those given codes in
+    # e.vote_symbols_c[cid] when the vote store was built; ballots without
+    # a reported vote for cid add ("-NoSuchContest",))
     for cid in e.cids:
+        vote_symbols = e.vote_symbols_c[cid]
         for pbcid in e.possible_pbcid_c[cid]:
-            for bid in e.bids_p[pbcid]:
-                if bid in e.rv_cpb[cid][pbcid]:
-                    rv = e.rv_cpb[cid][pbcid][bid]
-                else:
-                    rv = ("-NoSuchContest",)
-                utils.nested_set(e.votes_c, [cid, rv], True)
-                for selid in rv:
-                    if ids.is_writein(selid) or ids.is_error_selid(selid):
-                        e.selids_c[cid][selid] = True
-
-def compute_rn_cpr(e):
-    """ Set e.rn_cpr[cid][pbcid][rv] to number in pbcid with reported vote rv. """
+            if not e.rv_present_cp[cid][pbcid].all():
+                vote_symbols.add(vote_store.NO_SUCH_CONTEST)
+        for rv in vote_symbols:
+            utils.nested_set(e.votes_c, [cid, rv], True)
+            for selid in rv:
+                if ids.is_writein(selid) or ids.is_error_selid(selid):
+                    e.selids_c[cid][selid] = True
+
+def compute_reported_counts(e):
+    """
+    Compute, in one pass over the reported votes (e.rv_code_cp; see
+    vote_store.py):
+        e.rn_cpr[cid][pbcid][rv]  number in pbcid with reported vote rv
+                                  for cid (for each rv in e.votes_c[cid])
+        e.rn_c[cid]               number of reported votes cast in cid
+        e.rn_p[pbcid]             number of reported votes cast in pbcid
+        e.rn_cr[cid][rv]          number of reported votes rv in cid
+    Ballots with no reported vote for a contest are not counted for it.
+    """
 
+    e.rn_p = {pbcid: 0 for pbcid in e.pbcids}
     for cid in e.cids:
+        vote_symbols = e.vote_symbols_c[cid]
+        rv_codes = [(rv, vote_symbols.code(rv)) for rv in e.votes_c[cid]]
+        counts_r = np.zeros(len(vote_symbols), dtype=np.int64)
         e.rn_cpr[cid] = {}
         for pbcid in e.possible_pbcid_c[cid]:
-            e.rn_cpr[cid][pbcid] = {}
-            for rv in e.votes_c[cid]:
-                e.rn_cpr[cid][pbcid][rv] = len([bid for bid in e.bids_p[pbcid]
-                                                if bid in e.rv_cpb[cid][pbcid] and \
-                                                e.rv_cpb[cid][pbcid][bid] == rv])
-
-
-def compute_rn_c(e):    
-    """ 
-    Compute e.rn_c[cid] as number of reported votes cast in contest cid. 
-
-    (From e.rn_cpr)
-    """
-    
-    for cid in e.cids:
-        e.rn_c[cid] = sum([e.rn_cpr[cid][pbcid][rv]
-                           for pbcid in e.rn_cpr[cid]
-                           for rv in e.votes_c[cid]])
-
-
-def compute_rn_p(e):
-    """ Compute e.rn_p[pbcid] as number of reported votes cast in collection pbcid. """
-
-    for pbcid in e.pbcids:
-        e.rn_p[pbcid] = sum([e.rn_cpr[cid][pbcid][rv]
-                             for cid in e.rn_cpr
-                             for rv in e.votes_c[cid]])        
-
-
-def compute_rn_cr(e):
-    """ 
-    Compute  e.rn_cr[cid][rv] as reported number cast for 
-    reported vote rv in cid. 
-    """
-    
-    for cid in e.cids:
-        e.rn_cr[cid] = {}
-        for pbcid in e.rn_cpr[cid]:
-            for rv in e.votes_c[cid]:
-                if rv not in e.rn_cr[cid]:
-                    e.rn_cr[cid][rv] = 0
-                if rv not in e.rn_cpr[cid][pbcid]:
-                    e.rn_cpr[cid][pbcid][rv] = 0
-                e.rn_cr[cid][rv] += e.rn_cpr[cid][pbcid][rv]
+            code = e.rv_code_cp[cid][pbcid]
+            counts = np.bincount(code[e.rv_present_cp[cid][pbcid]],
+                                 minlength=len(vote_symbols))
+            counts_r += counts
+            e.rn_cpr[cid][pbcid] = {rv: int(counts[i]) for (rv, i) in rv_codes}
+            e.rn_p[pbcid] = e.rn_p.get(pbcid, 0) + \
+                            sum(e.rn_cpr[cid][pbcid].values())
+        e.rn_cr[cid] = {rv: int(counts_r[i]) for (rv, i) in rv_codes}
+        e.rn_c[cid] = sum(e.rn_cr[cid].values())
 
 
 def finish_reported(e):
@@ -230,12 +212,11 @@ def finish_reported(e):
     or that need conversion (e.g. strings-->tuples from json keys).
     """
 
+    symbols.build_symbol_tables(e)
+    vote_store.build_reported_vote_store(e)
     check_reported_selids(e)
 
-    compute_rn_cpr(e)
-    compute_rn_c(e)    
-    compute_rn_p(e)
-    compute_rn_cr(e)
+    compute_reported_counts(e)
 
 
 def check_reported(e):
@@ -325,32 +306,16 @@ def check_reported(e):
     for pbcid in e.pbcids:
         # if not isinstance(e.bids_p[pbcid], dict):
         #     utils.myerror("e.bids_p[{}] is not a dict.".format(pbcid))
-        if not isinstance(e.bids_p[pbcid], list):
-            utils.myerror("e.bids_p[{}] is not a list.".format(pbcid))
+        if not isinstance(e.bids_p[pbcid], collections.abc.Sequence):
+            utils.myerror("e.bids_p[{}] is not a sequence.".format(pbcid))
 
-    if not isinstance(e.rv_cpb, dict):
-        utils.myerror("e.rv_cpb is not a dict.")
-    for cid in e.rv_cpb:
-        if cid not in e.cids:
-            utils.mywarning("e.rv_cpb key `{}` is not in e.cids.".format(cid))
-        for pbcid in e.rv_cpb[cid]:
-            if pbcid not in e.pbcids:
-                utils.mywarning("e.rv_cpb[{}] key `{}` is not in e.pbcids."
-                          .format(cid, pbcid))
-            if not isinstance(e.rv_cpb[cid][pbcid], dict):
-                utils.myerror("e.rv_cpb[{}][{}] is not a dict.".format(cid, pbcid))
-            bidsset = set(e.bids_p[pbcid])
-            for bid in e.rv_cpb[cid][pbcid]:
-                if bid not in bidsset:
-                    utils.mywarning("bid `{}` from e.rv_cpb[{}][{}] is not in e.bids_p[{}]."
-                              .format(bid, cid, pbcid, pbcid))
+    # (votes for cids, pbcids, or bids not in the election are reported
+    # when the vote store is built; see vote_store.encode_votes)
     for cid in e.cids:
-        if cid not in e.rv_cpb:
-            utils.mywarning("cid `{}` is not a key in e.rv_cpb.".format(cid))
         for pbcid in e.possible_pbcid_c[cid]:
-            if pbcid not in e.rv_cpb[cid]:
+            if not e.rv_present_cp[cid][pbcid].any():
                 utils.mywarning(("pbcid `{}` from e.possible_pbcid_c[{}] "
-                                 "is not a key for e.rv_cpb[{}].")
+                                 "has no reported votes for {}.")
                                 .format(pbcid, cid, cid))
 
     if not isinstance(e.ro_c, dict):
@@ -382,9 +347,9 @@ def check_audited_votes(e):
                           .format(cid, pbcid))
             if not isinstance(e.av_cpb[cid][pbcid], dict):
                 utils.myerror("e.av_cpb[{}][{}] is not a dict.".format(cid, pbcid))
-            bidsset = set(e.bids_p[pbcid])
+            bid_symbols = e.bid_symbols_p[pbcid]
             for bid in e.av_cpb[cid][pbcid]:
-                if bid not in bidsset:
+                if bid not in bid_symbols:
                     utils.mywarning("bid `{}` from e.av_cpb[{}][{}] is not in e.bids_p[{}]."
                               .format(bid, cid, pbcid, pbcid))
 
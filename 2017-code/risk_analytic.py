@@ -0,0 +1,313 @@
+# risk_analytic.py
+# python3
+
+"""
+Routines to compute Bayes risk for a contest analytically, rather than
+by Monte Carlo simulation of the posterior.
+
+Called by risk_bayes.py for measurements whose Risk Measurement Method
+is "Analytic".
+
+The posterior used is the same as in risk_bayes.compute_risk: for each
+stratum (pbcid, rv) with hyperparameters a (sample tally plus
+pseudocounts, summing to A) and nonsample size N, the test tally gets
+    a + N * D,   where D ~ Dirichlet(a).
+For large N this is well approximated by a multivariate normal with
+mean a + N*p and covariance N**2 * (diag(p) - p p^T) / (A+1), where
+p = a/A.  Summing over strata gives a normal approximation to the test
+tally, and so to the margins between the reported winner and each other
+possible winner; the risk is the chance that some margin is not positive.
+
+For a two-way contest (such as a Yes/No measure) no approximation is
+needed; see compute_risk_beta.
+"""
+
+import math
+import numpy as np
+import statistics
+
+import audit
+import risk_bayes
+import utils
+
+# Strata with fewer than e.analytic_min_stratum_size unsampled ballots
+# are "small"; if they hold more than this fraction of all unsampled
+# ballots for the contest, the normal approximation is not trusted, and
+# we fall back to Monte Carlo.
+ANALYTIC_SMALL_FRACTION = 0.01
+
+# Competitors whose margin is more than this many standard deviations
+# behind the reported winner are ignored (their chance of winning is
+# below 1e-15).
+ANALYTIC_MAX_Z = 8.0
+
+# Number of cells used to discretize each Beta distribution, and
+# (roughly) the number of lattice cells for the distribution of the
+# margin, in compute_risk_beta.
+BETA_GRID_SIZE = 400
+BETA_LATTICE_SIZE = 2**16
+
+
+def normal_is_accurate(e, plan):
+    """
+    Return True if the strata in plan are large enough for the normal
+    approximation to be used.
+
+    Even then the approximation is only approximate: it ignores the
+    skew of the posterior, which is large for strata with few sampled
+    ballots of some vote (such as the ballots whose reported and actual
+    votes differ), and which shifts the risk of a contest that more
+    than two votes can win by as much as a quarter of its value.  So if
+    the approximation is used for such a contest, or with any small
+    strata, a warning is given.
+    """
+
+    sizes = np.abs(plan.nonsample_sizes)
+    small = (sizes > 0) & (sizes < e.analytic_min_stratum_size)
+    if sizes[small].sum() > ANALYTIC_SMALL_FRACTION * sizes.sum():
+        return False
+    reasons = []
+    if np.count_nonzero(plan.can_win) > 2:
+        reasons.append("{} votes can win".format(np.count_nonzero(plan.can_win)))
+    if small.any():
+        reasons.append("{} strata have fewer than {} unsampled ballots"
+                       .format(np.count_nonzero(small),
+                               e.analytic_min_stratum_size))
+    if len(reasons) > 0:
+        utils.mywarning("Normal approximation to risk of contest {} is "
+                        "rough ({}); check it with the vectorized engine."
+                        .format(plan.cid, "; ".join(reasons)))
+    return True
+
+
+def tally_moments(e, plan):
+    """
+    Return (mean, cov), the mean vector and covariance matrix (indexed
+    by the votes of plan) of the normal approximation to the test tally.
+    """
+
+    mean = np.zeros(len(plan.votes))
+    cov = np.zeros((len(plan.votes), len(plan.votes)))
+    for (alphas, nonsample_size) in zip(plan.alphas, plan.nonsample_sizes):
+        total = alphas.sum()
+        p = alphas / total
+        mean += alphas + nonsample_size * p
+        cov += (nonsample_size ** 2 / (total + 1.0)) * \
+               (np.diag(p) - np.outer(p, p))
+    return (mean, cov)
+
+
+def compute_risk_analytic(e, plan, trials, rs=None):
+    """
+    Return pair (risk, number of trials run) for the contest of plan,
+    computed from the normal approximation to the posterior.
+
+    With one competitor left (after dropping those hopelessly far
+    behind) the risk is a normal CDF, and no trials are run.  With
+    several, it is the chance that a (low-dimensional) normal vector of
+    margins has a nonpositive component, estimated from trials draws
+    of that vector, which are cheap compared to drawing the posterior.
+    Two-way contests are handed to compute_risk_beta, which is exact.
+    If the strata are too small for the approximation (see
+    normal_is_accurate), fall back to risk_bayes.compute_risk_vectorized.
+    """
+
+    if is_two_way(e, plan):
+        return compute_risk_beta(e, plan, trials, rs)
+    if not normal_is_accurate(e, plan):
+        return risk_bayes.compute_risk_vectorized(e, plan, trials, rs)
+
+    w = plan.ro_index
+    if w < 0 or not plan.can_win[w]:
+        return (1.0, 0)     # reported outcome can't be the outcome
+    competitors = [j for j in range(len(plan.votes))
+                   if plan.can_win[j] and j != w]
+
+    (mean, cov) = tally_moments(e, plan)
+    margin_means = []
+    margin_rows = []
+    for j in competitors:
+        # margin X_w - X_j as a linear combination of the tally
+        row = np.zeros(len(plan.votes))
+        row[w] = 1.0
+        row[j] = -1.0
+        margin_mean = row @ mean
+        margin_sd = np.sqrt(max(row @ cov @ row, 0.0))
+        if margin_sd == 0.0:
+            if margin_mean <= 0.0:
+                return (1.0, 0)
+            continue
+        if margin_mean / margin_sd < ANALYTIC_MAX_Z:
+            margin_means.append(margin_mean)
+            margin_rows.append(row)
+
+    if len(margin_means) == 0:
+        return (0.0, 0)
+    if len(margin_means) == 1:
+        row = margin_rows[0]
+        margin_sd = np.sqrt(row @ cov @ row)
+        return (statistics.NormalDist().cdf(-margin_means[0] / margin_sd), 0)
+
+    if rs == None:
+        rs = audit.auditRandomState
+    rows = np.array(margin_rows)
+    margins = rs.multivariate_normal(np.array(margin_means),
+                                     rows @ cov @ rows.T,
+                                     size=trials)
+    wrong_outcome_count = int(np.count_nonzero((margins <= 0.0).any(axis=1)))
+    return (wrong_outcome_count / trials, trials)
+
+
+##############################################################################
+# Two-way contests
+#
+# When only two votes y and n can win, each stratum contributes
+#     c + N * (D_y - D_n)  =  c + N * T * (2B - 1)
+# to the margin X_y - X_n, where c = a_y - a_n, and
+#     T = D_y + D_n  ~  Beta(a_y + a_n, a_rest)
+#     B = D_y / T    ~  Beta(a_y, a_n)
+# are independent (a_rest being the total hyperparameter of the votes that
+# can't win: undervotes, overvotes, "-Invalid", and so on).  The margin is
+# thus a sum of independent stratum terms, whose distributions we compute
+# on a common lattice and convolve.
+
+def is_two_way(e, plan):
+    """
+    Return True if plan is for a plurality contest that exactly two
+    votes can win.
+    """
+
+    return e.contest_type_c[plan.cid].lower() == "plurality" and \
+           np.count_nonzero(plan.can_win) == 2
+
+
+def betainc(a, b, x):
+    """
+    Return regularized incomplete beta function I_x(a, b) for scalars
+    a, b > 0 and each element of numpy array x (with 0 <= x <= 1).
+
+    Uses the continued fraction of Numerical Recipes (section 6.4),
+    evaluated by the modified Lentz method for all of x at once.
+    """
+
+    x = np.asarray(x, dtype=float)
+    result = np.where(x >= 1.0, 1.0, 0.0)
+    inside = (x > 0.0) & (x < 1.0)
+    xi = x[inside]
+    log_front = math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + \
+                a * np.log(xi) + b * np.log1p(-xi)
+    front = np.exp(log_front)
+    direct = xi < (a + 1.0) / (a + b + 2.0)
+    values = np.empty(len(xi))
+    values[direct] = front[direct] * \
+        beta_continued_fraction(a, b, xi[direct]) / a
+    values[~direct] = 1.0 - front[~direct] * \
+        beta_continued_fraction(b, a, 1.0 - xi[~direct]) / b
+    result[inside] = values
+    return result
+
+
+def beta_continued_fraction(a, b, x, max_iterations=100000, eps=1e-14):
+    """ Continued fraction for betainc, for each element of array x. """
+
+    tiny = 1e-300
+    c = np.ones(len(x))
+    d = 1.0 - (a + b) * x / (a + 1.0)
+    d = 1.0 / np.where(np.abs(d) < tiny, tiny, d)
+    h = d.copy()
+    for m in range(1, max_iterations + 1):
+        for aa in (m * (b - m) * x / ((a + 2*m - 1.0) * (a + 2*m)),
+                   -(a + m) * (a + b + m) * x / ((a + 2*m) * (a + 2*m + 1.0))):
+            d = 1.0 + aa * d
+            d = 1.0 / np.where(np.abs(d) < tiny, tiny, d)
+            c = 1.0 + aa / c
+            c = np.where(np.abs(c) < tiny, tiny, c)
+            delta = c * d
+            h *= delta
+        if np.all(np.abs(delta - 1.0) < eps):
+            break
+    return h
+
+
+def beta_cells(a, b):
+    """
+    Discretize Beta(a, b): return pair (values, masses) of numpy arrays,
+    giving the midpoints of BETA_GRID_SIZE cells and the probability
+    of each cell.  The cells cover the mean plus or minus 12 standard
+    deviations (within [0, 1]); the tails are folded into the end cells.
+    """
+
+    mean = a / (a + b)
+    sd = math.sqrt(a * b / ((a + b) ** 2 * (a + b + 1.0)))
+    edges = np.linspace(max(0.0, mean - 12.0 * sd),
+                        min(1.0, mean + 12.0 * sd),
+                        BETA_GRID_SIZE + 1)
+    cdf = betainc(a, b, edges)
+    cdf[0] = 0.0
+    cdf[-1] = 1.0
+    return ((edges[:-1] + edges[1:]) / 2.0, np.diff(cdf))
+
+
+def compute_risk_beta(e, plan, trials, rs=None):
+    """
+    Return pair (risk, number of trials run) for a contest of plan,
+    computed by numeric integration (no trials are run).  Fall back to
+    risk_bayes.compute_risk_vectorized if the contest is not two-way
+    (see is_two_way).
+
+    For each stratum the pair (T, B) (see above) is discretized, giving
+    the distribution of the stratum's contribution to the margin between
+    the reported winner and the other vote that can win; these are
+    rounded to a common lattice and convolved (by FFT) to give the
+    distribution of the margin, and the risk is the chance that it is
+    negative.
+    """
+
+    if not is_two_way(e, plan):
+        return risk_bayes.compute_risk_vectorized(e, plan, trials, rs)
+
+    w = plan.ro_index
+    if w < 0 or not plan.can_win[w]:
+        return (1.0, 0)     # reported outcome can't be the outcome
+    (other,) = [j for j in np.flatnonzero(plan.can_win) if j != w]
+
+    # margin values and masses for each stratum
+    stratum_values = []
+    stratum_masses = []
+    for (alphas, nonsample_size) in zip(plan.alphas, plan.nonsample_sizes):
+        a_w = alphas[w]
+        a_other = alphas[other]
+        a_rest = alphas.sum() - a_w - a_other
+        if a_rest > 0.0:
+            (t_values, t_masses) = beta_cells(a_w + a_other, a_rest)
+        else:
+            (t_values, t_masses) = (np.ones(1), np.ones(1))
+        (b_values, b_masses) = beta_cells(a_w, a_other)
+        values = (a_w - a_other) + \
+                 nonsample_size * np.outer(t_values, 2.0 * b_values - 1.0)
+        stratum_values.append(values.ravel())
+        stratum_masses.append(np.outer(t_masses, b_masses).ravel())
+
+    lows = [values.min() for values in stratum_values]
+    width = sum(values.max() - low
+                for (values, low) in zip(stratum_values, lows))
+    if width == 0.0:
+        # margin is known exactly; ties go to the lower index
+        margin = sum(lows)
+        return (float(margin < 0.0 or (margin == 0.0 and other < w)), 0)
+
+    # distribution of margin on lattice sum(lows) + k * step
+    step = width / BETA_LATTICE_SIZE
+    size = BETA_LATTICE_SIZE + len(stratum_values) + 1
+    fft_size = 1 << (size - 1).bit_length()
+    transform = np.ones(fft_size // 2 + 1, dtype=complex)
+    for (values, masses, low) in zip(stratum_values, stratum_masses, lows):
+        cells = np.rint((values - low) / step).astype(int)
+        transform *= np.fft.rfft(np.bincount(cells, weights=masses), fft_size)
+    margin_masses = np.clip(np.fft.irfft(transform, fft_size)[:size], 0.0, None)
+
+    # chance margin is negative, interpolating within the cell at zero
+    edges = sum(lows) + (np.arange(size + 1) - 0.5) * step
+    cdf = np.concatenate(([0.0], np.cumsum(margin_masses)))
+    risk = np.interp(0.0, edges, cdf) / cdf[-1]
+    return (float(risk), 0)
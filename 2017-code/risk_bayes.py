@@ -15,12 +15,21 @@ a significant change to the code base.  (Some thoughts, albeit
 primitive, are sketched in risk_bayes_2.py.)
 """
 
-import copy
+import concurrent.futures
+import hashlib
+import json
+import math
 import numpy as np
+import os
+import statistics
+import time
 
 import multi
 import audit
 import outcomes
+import risk_analytic
+import timings
+import utils
 
 ##############################################################################
 # Gamma distribution
@@ -47,36 +56,179 @@ def gamma(k, rs=None):
 
 # Dirichlet distribution
 
-def dirichlet(tally):
+def dirichlet(tally, rs=None):
     """ 
     Given tally dict mapping votes (tuples of selids) to nonnegative ints (counts), 
     return dict mapping those votes to elements of Dirichlet distribution sample on
     those votes, where tally values are used as Dirichlet hyperparameters.
     The values produced sum to one.
+    Parameter rs, if present, is a numpy.random.RandomState object.
     """
 
     # make sure order of applying gamma is deterministic, for reproducibility
-    dir = {vote: gamma(tally[vote]) for vote in sorted(tally)}
+    dir = {vote: gamma(tally[vote], rs) for vote in sorted(tally)}
     total = sum(dir.values())
     dir = {vote: dir[vote] / total for vote in dir}
     return dir
 
 
+def gamma_matrix(alphas, trials, rs=None):
+    """
+    Vectorized form of gamma.
+    Given 1-d array alphas of nonnegative values, return a 
+    (trials x len(alphas)) array whose column j holds independent
+    samples from the gamma distribution with mean alphas[j].
+    As with gamma(), a zero mean gives a zero column.
+    Parameter rs, if present, is a numpy.random.RandomState object.
+
+    All gamma variates for the matrix are drawn in one call, in
+    row-major (trial, vote) order, so the result is deterministic
+    given the state of rs.
+    """
+
+    if rs == None:
+        rs = audit.auditRandomState
+    alphas = np.asarray(alphas, dtype=float)
+    g = np.zeros((trials, len(alphas)))
+    positive = alphas > 0.0
+    if positive.any():
+        g[:, positive] = rs.gamma(alphas[positive],
+                                  size=(trials, int(positive.sum())))
+    return g
+
+
+def dirichlet_matrix(alphas, trials, rs=None):
+    """
+    Vectorized form of dirichlet.
+    Given 1-d array alphas of nonnegative Dirichlet hyperparameters,
+    return a (trials x len(alphas)) array whose rows are independent
+    Dirichlet samples with those hyperparameters.  
+    Parameter rs, if present, is a numpy.random.RandomState object.
+    """
+
+    g = gamma_matrix(alphas, trials, rs)
+    return g / g.sum(axis=1, keepdims=True)
+
+
 ##############################################################################
 # Risk measurement (Bayes risk)
 
-def compute_risk(e, mid, sn_tcpra, trials=None):
+# Engines available for simulating the posterior in a "Bayes" measurement.
+# The engine is given by "Param 1" of the measurement in the contest audit
+# spec file; an empty value means "scalar" (the original reference loop).
+# Measurements with method "Analytic" use the "analytic" engine (see
+# risk_analytic.py) regardless of their parameters; those with any other
+# method (such as "Frequentist", whose parameters mean something else)
+# are computed as Bayes risks by the "scalar" engine.
+RISK_ENGINES = ["scalar", "vectorized", "adaptive", "beta", "control",
+                "importance"]
+
+
+def risk_engine(e, mid):
+    """ Return name of engine to use for measurement mid (see RISK_ENGINES). """
+
+    if e.risk_method_m.get(mid) == "Analytic":
+        return "analytic"
+    if e.risk_method_m.get(mid) != "Bayes":
+        return "scalar"
+    params = e.risk_measurement_parameters_m.get(mid, ("", ""))
+    engine = params[0].strip().lower() if len(params) > 0 else ""
+    return engine if engine != "" else "scalar"
+
+
+class PosteriorPlan(object):
+    """
+    Everything about the posterior for one contest at one stage that
+    does not change from trial to trial, compiled once (by
+    compile_posterior_plan) so that the trial loops of the risk engines
+    need only index into arrays.
+
+    Attributes:
+        cid             the contest
+        stage_time      stage the plan was compiled for
+        votes           sorted list of votes for cid (e.votes_c[cid], plus
+                        any actual votes seen in sample but not in e.votes_c)
+        vote_index      dict mapping each vote to its index in votes
+        strata          list of (pbcid, rv) strata, in sorted order
+        alphas          2-d array (strata x votes) of Dirichlet
+                        hyperparameters (sample tally plus pseudocounts)
+        nonsample_sizes 1-d array (strata) of unsampled ballot counts
+        can_win         boolean array (votes): votes that may win
+        ro_index        reported outcome e.ro_c[cid], encoded as by
+                        outcomes.encode_outcome
+
+    The plan, and so the order in which the engines draw their random
+    numbers, depends on the sample tallies for the whole contest: two
+    stages with identical tallies for cid give identical plans (and
+    risks, given the same random stream), but a vote seen in the sample
+    that is not in e.votes_c[cid] adds a column, shifting every later
+    draw.  So risks are not comparable draw-for-draw between stages
+    merely because the tallies of some strata are unchanged.
+    """
+
+    pass
+
+
+def compile_posterior_plan(e, cid, sn_tcpra):
+    """
+    Return PosteriorPlan for contest cid at stage e.stage_time,
+    with sample tallies taken from sn_tcpra (which is identical in 
+    structure to, and may in fact be identical to, e.sn_tcpra).
+    """
+
+    plan = PosteriorPlan()
+    plan.cid = cid
+    plan.stage_time = e.stage_time
+    sn_cpra = sn_tcpra[e.stage_time][cid]
+
+    votes = set(e.votes_c[cid])
+    for pbcid in e.possible_pbcid_c[cid]:
+        for rv in sn_cpra[pbcid]:
+            votes.update(sn_cpra[pbcid][rv])
+    plan.votes = sorted(votes)
+    plan.vote_index = {vote: i for (i, vote) in enumerate(plan.votes)}
+
+    # Use "sorted" to preserve deterministic operation.
+    plan.strata = [(pbcid, rv)
+                   for pbcid in sorted(e.possible_pbcid_c[cid])
+                   for rv in sorted(sn_cpra[pbcid])]
+    plan.alphas = np.full((len(plan.strata), len(plan.votes)),
+                          float(e.pseudocount_base))
+    plan.nonsample_sizes = np.zeros(len(plan.strata))
+    for (i, (pbcid, rv)) in enumerate(plan.strata):
+        sample_tally = sn_cpra[pbcid][rv]
+        if rv in plan.vote_index:
+            plan.alphas[i, plan.vote_index[rv]] = e.pseudocount_match
+        for av in sample_tally:
+            plan.alphas[i, plan.vote_index[av]] += sample_tally[av]
+        stratum_size = e.rn_cpr[cid][pbcid][rv]
+        sample_size = sum(sample_tally.values())
+        plan.nonsample_sizes[i] = stratum_size - sample_size
+
+    plan.can_win = outcomes.can_win_mask(e, cid, plan.votes)
+    plan.ro_index = outcomes.encode_outcome(plan.votes, e.ro_c[cid])
+    return plan
+
+
+def compute_risk(e, mid, sn_tcpra, trials=None, rs=None, plan=None):
     """ 
     Compute (estimate) Bayesian risk (chance that reported 
-    outcome is wrong for contest e.cid_m[mid]).
+    outcome is wrong for contest e.cid_m[mid]), using
+    the engine selected for mid (see risk_engine).
+    Return the risk, which is also recorded in e.risk_tm.
+
     We take sn_tcpra here as argument rather than just use e.sn_tcpra so
-    we can call compute_contest_risk with modified sample counts.
-    (This option not yet used, but might be later, when optimizing
-    workload.)
+    we can call compute_risk with modified sample counts.  (When
+    planning workload, compute_risk_with_tweak does so without recording
+    the hypothetical risk; see simulate_group_risk.)
     Here sn_tcpra is identical in structure to (and may in fact be
     identical to) e.sn_tcpra.
     Here trials is the number of trials to run to obtain the desired
-    precision in the risk estimate.
+    precision in the risk estimate (default e.n_trials).
+    Parameter rs, if present, is the numpy.random.RandomState object
+    to draw from (default audit.auditRandomState).
+    Parameter plan, if present, is the PosteriorPlan for the contest
+    compiled from sn_tcpra; otherwise it is compiled here.
 
     This method is the heart of the Bayesian post-election audit method.
     But it could be replaced by a frequentist approach instead, at
@@ -88,45 +240,876 @@ def compute_risk(e, mid, sn_tcpra, trials=None):
     reported vote in a noCVR paper ballot collection.
     """
 
-    cid = e.cid_m[mid]
-    wrong_outcome_count = 0
+    return compute_group_risk(e, [mid], sn_tcpra, trials, rs, plan)
+
+
+def measurement_groups(e, mids=None):
+    """
+    Return list of groups (lists) of mids, where the measurements in a 
+    group are on the same contest with the same engine, and so can all
+    be evaluated against one simulation of the contest's posterior.
+    Groups, and mids within each group, are in the order of e.mids.
+    If mids is given, only those measurements are grouped.
+    """
+
+    if mids == None:
+        mids = e.mids
+    mids_k = {}
+    for mid in e.mids:
+        if mid not in mids:
+            continue
+        mids_k.setdefault((e.cid_m[mid], risk_engine(e, mid)), []).append(mid)
+    return list(mids_k.values())
+
+
+def compute_group_risk(e, mids, sn_tcpra, trials=None, rs=None, plan=None):
+    """
+    Like compute_risk, but for a group of measurements mids (as given
+    by measurement_groups).  The posterior is simulated just once for
+    the whole group, and each measurement gets the resulting risk.
+    Return the risk.
+    """
+
+    if plan == None:
+        plan = compile_posterior_plan(e, e.cid_m[mids[0]], sn_tcpra)
+    (risk, trials_done, risk_se, ess) = \
+        simulate_group_risk(e, mids, plan, trials, rs)
+    for mid in mids:
+        e.risk_tm[e.stage_time][mid] = risk
+        e.trials_tm[e.stage_time][mid] = trials_done
+        e.risk_se_tm[e.stage_time][mid] = risk_se
+        e.ess_tm[e.stage_time][mid] = ess
+    return risk
+
+
+def simulate_group_risk(e, mids, plan, trials=None, rs=None):
+    """
+    Estimate the risk for group mids of measurements, with posterior
+    plan, using the engine selected for mids (see risk_engine).
+    Return tuple (risk, number of trials run, standard error of risk,
+    effective sample size).  Unlike compute_group_risk, this doesn't
+    record the risk in e.risk_tm (and so on), so it may be used for
+    hypothetical samples (see compute_risk_with_tweak).
+    """
+
     if trials == None:
         trials = e.n_trials
+    engine = risk_engine(e, mids[0])
+    risk_se = None
+    ess = None
+    if engine == "scalar":
+        (risk, trials_done) = compute_risk_scalar(e, plan, trials, rs)
+    elif engine == "vectorized":
+        (risk, trials_done) = compute_risk_vectorized(e, plan, trials, rs)
+    elif engine == "adaptive":
+        (risk, trials_done) = compute_risk_adaptive(e, mids, plan, trials, rs)
+    elif engine == "beta":
+        (risk, trials_done) = \
+            risk_analytic.compute_risk_beta(e, plan, trials, rs)
+    elif engine == "analytic":
+        (risk, trials_done) = \
+            risk_analytic.compute_risk_analytic(e, plan, trials, rs)
+    elif engine == "control":
+        (risk, trials_done, risk_se) = \
+            compute_risk_control(e, plan, trials, rs)
+    elif engine == "importance":
+        (risk, trials_done, risk_se, ess) = \
+            compute_risk_importance(e, plan, trials, rs)
+    else:
+        utils.myerror("Unknown risk engine `{}` for measurement {}."
+                      .format(engine, mids[0]))
+    if risk_se == None:
+        risk_se = risk_standard_error(risk, trials_done)
+    if ess == None:
+        ess = float(trials_done)
+    return (risk, trials_done, risk_se, ess)
+
+
+def risk_standard_error(risk, trials):
+    """
+    Return standard error of a risk estimated as the fraction of trials
+    with a wrong outcome (zero if no trials were run, as when the risk
+    was computed numerically).
+    """
+
+    if trials == 0:
+        return 0.0
+    return math.sqrt(risk * (1.0 - risk) / trials)
+
+
+# Each engine below returns a pair (risk, number of trials run),
+# except compute_risk_control, which also returns the standard error,
+# and compute_risk_importance, which also returns the standard error and
+# effective sample size.
+
+def compute_risk_scalar(e, plan, trials, rs=None):
+    """ 
+    Reference engine for compute_risk: run trials one at a time.
+    For each trial, draw from posterior for each paper ballot 
+    collection, stratified by reported vote, and sum them.
+    """
+
+    wrong_outcome_count = 0
     for trial in range(trials):
-        test_tally = {vote: 0 for vote in e.votes_c[cid]}
-        for pbcid in sorted(e.possible_pbcid_c[cid]):
-            # Draw from posterior for each paper ballot collection, sum them.
-            # Stratify by reported vote.
-            for rv in sorted(sn_tcpra[e.stage_time][cid][pbcid]):
-                tally = sn_tcpra[e.stage_time][cid][pbcid][rv].copy()
-                for av in e.votes_c[cid]:
-                    if av not in tally:
-                        tally[av] = 0
-                    tally[av] += (e.pseudocount_match if av==rv
-                                  else e.pseudocount_base)
-                dirichlet_dict = dirichlet(tally)
-                stratum_size = e.rn_cpr[cid][pbcid][rv]
-                # sample_size = sn_tcpr[e.stage_time][cid][pbcid][rv]  
-                sample_size = sum([sn_tcpra[e.stage_time][cid][pbcid][rv][av]
-                                   for av in sn_tcpra[e.stage_time][cid][pbcid][rv]])
-                nonsample_size = stratum_size - sample_size
-                for av in sorted(tally):
-                    test_tally[av] += tally[av]
-                    test_tally[av] += dirichlet_dict[av] * nonsample_size
-        if e.ro_c[cid] != outcomes.compute_outcome(e, cid, test_tally):  
+        test_tally = np.zeros(len(plan.votes))
+        for (alphas, nonsample_size) in zip(plan.alphas, plan.nonsample_sizes):
+            # make sure order of applying gamma is deterministic
+            g = np.array([gamma(alpha, rs) for alpha in alphas])
+            test_tally += alphas
+            test_tally += g / g.sum() * nonsample_size
+        winner = outcomes.compute_outcome_batch(e, plan.cid,
+                                                test_tally.reshape(1, -1),
+                                                plan.can_win)[0]
+        if winner != plan.ro_index:
             wrong_outcome_count += 1
-    risk = wrong_outcome_count / e.n_trials
-    e.risk_tm[e.stage_time][mid] = risk
-    return risk
+    return (wrong_outcome_count / trials, trials)
 
 
-def compute_risks(e, st, trials=None):
+def compute_risk_vectorized(e, plan, trials, rs=None):
     """
-    Compute risks for all measurements, for current sample.
+    Same as compute_risk_scalar, but with all trials simulated at once
+    using numpy arrays (see count_wrong_outcomes_chunked), or in chunks
+    if e.risk_memory_budget is set.  Strata and votes are visited in the
+    same order as in compute_risk_scalar, so results are reproducible
+    given the audit seed (although they are not draw-for-draw identical
+    to those of compute_risk_scalar), and they are the same with or
+    without a memory budget.
     """
 
-    for mid in e.mids:
-        compute_risk(e, mid, st, trials)
+    wrong_outcome_count = count_wrong_outcomes_chunked(e, plan, trials, rs)
+    return (wrong_outcome_count / trials, trials)
+
+
+def count_wrong_outcomes(e, plan, trials, rs=None):
+    """
+    Simulate trials draws from the posterior described by plan, 
+    and return the number of those trials whose outcome differs
+    from the reported outcome.
+
+    For each stratum a whole (trials x votes) matrix of Dirichlet
+    samples is drawn with one call to dirichlet_matrix, and the test 
+    tallies for all trials are accumulated as rows of one 
+    (trials x votes) array.
+    """
+
+    test_tally = simulate_test_tallies(e, plan, trials, rs)
+    winners = outcomes.compute_outcome_batch(e, plan.cid, test_tally,
+                                             plan.can_win)
+    return int(np.count_nonzero(winners != plan.ro_index))
+
+
+def simulate_test_tallies(e, plan, trials, rs=None):
+    """
+    Return (trials x votes) array of test tallies drawn from the
+    posterior described by plan (see count_wrong_outcomes).
+    """
+
+    test_tally = np.zeros((trials, len(plan.votes)))
+    for (alphas, nonsample_size) in zip(plan.alphas, plan.nonsample_sizes):
+        test_tally += alphas
+        test_tally += dirichlet_matrix(alphas, trials, rs) * nonsample_size
+    return test_tally
+
+
+# Rough number of bytes of trial matrices needed per (trial, vote) cell
+# by count_wrong_outcomes_chunked: the gamma variates, their normalized
+# (Dirichlet) form and its scaled copy (float64 each), the test tally,
+# and the masked tally used by outcomes.plurality_batch.
+RISK_BYTES_PER_CELL = 40
+
+
+def trials_per_chunk(e, plan, trials):
+    """
+    Return number of trials count_wrong_outcomes_chunked may simulate
+    at once for plan while staying within e.risk_memory_budget bytes
+    (all of them, if e.risk_memory_budget is None).
+    """
+
+    if e.risk_memory_budget == None:
+        return trials
+    chunk = int(e.risk_memory_budget // (RISK_BYTES_PER_CELL * len(plan.votes)))
+    return max(1, min(trials, chunk))
+
+
+def count_wrong_outcomes_chunked(e, plan, trials, rs=None):
+    """
+    Same as count_wrong_outcomes, but simulating the trials in chunks
+    (see trials_per_chunk), so that memory use is bounded by
+    e.risk_memory_budget (if not None) however large trials is.  The
+    test tallies are accumulated in float32 if e.risk_float32 is True,
+    halving their size.
+
+    Each stratum draws from its own child stream, seeded from rs, and 
+    a numpy RandomState produces the same gamma variates whether they
+    are drawn in one call or in several; so the result depends only on
+    rs (and e.risk_float32), and not on the chunk size, nor on whether
+    there is a memory budget at all.  (It does differ from that of
+    count_wrong_outcomes, which draws every stratum from rs itself.)
+    """
+
+    if rs == None:
+        rs = audit.auditRandomState
+    stratum_rss = [np.random.RandomState(seed)
+                   for seed in rs.randint(0, 2**32, size=(len(plan.strata), 4))]
+    dtype = np.float32 if e.risk_float32 else np.float64
+    chunk = trials_per_chunk(e, plan, trials)
+    wrong_outcome_count = 0
+    for start in range(0, trials, chunk):
+        chunk_trials = min(chunk, trials - start)
+        test_tally = np.zeros((chunk_trials, len(plan.votes)), dtype=dtype)
+        for (alphas, nonsample_size, stratum_rs) in \
+                zip(plan.alphas, plan.nonsample_sizes, stratum_rss):
+            test_tally += alphas
+            test_tally += dirichlet_matrix(alphas, chunk_trials, stratum_rs) * \
+                          nonsample_size
+        winners = outcomes.compute_outcome_batch(e, plan.cid, test_tally,
+                                                 plan.can_win)
+        wrong_outcome_count += int(np.count_nonzero(winners != plan.ro_index))
+    return wrong_outcome_count
+
+
+##############################################################################
+# Control variates
+
+# Number of competitors (those with the closest expected margins to the
+# reported winner) whose margins serve as control variates.
+CONTROL_VARIATE_COMPETITORS = 3
+
+# The controls are used only if there are at least this many trials with
+# a wrong outcome (with fewer, the fitted regression, and the standard
+# error it gives, are unreliable), and only if they explain at least
+# this fraction of the variance of the wrong-outcome indicators (with
+# less, they hardly reduce the error).  Otherwise the plain estimate and
+# its binomial standard error are returned.
+CONTROL_VARIATE_MIN_WRONG = 30
+CONTROL_VARIATE_MIN_R2 = 0.1
+
+
+def compute_risk_control(e, plan, trials, rs=None):
+    """
+    Same as compute_risk_vectorized, but with the risk estimated using
+    control variates, so as to reach a given standard error in fewer
+    trials.  Return triple (risk, number of trials run, standard error).
+
+    The controls are functions of the margins m between the reported
+    winner and its closest competitors, whose exact posterior means and
+    variances are known (see risk_analytic.tally_moments): for each
+    margin, z = (m - mean) / sd and z**2 - 1, both of mean zero.  The 
+    risk is the mean of the wrong-outcome indicators less their fitted
+    (least-squares) regression on the controls; the fewer wrong 
+    outcomes the margins fail to explain, the smaller the error.
+    For small risks the margins explain little, and the plain estimate
+    is returned (see CONTROL_VARIATE_MIN_WRONG and CONTROL_VARIATE_MIN_R2).
+    """
+
+    test_tally = simulate_test_tallies(e, plan, trials, rs)
+    winners = outcomes.compute_outcome_batch(e, plan.cid, test_tally,
+                                             plan.can_win)
+    wrong = (winners != plan.ro_index).astype(float)
+    risk = wrong.mean()
+
+    w = plan.ro_index
+    wrong_outcome_count = int(wrong.sum())
+    if w < 0 or not plan.can_win[w] or \
+       min(wrong_outcome_count, trials - wrong_outcome_count) < \
+       CONTROL_VARIATE_MIN_WRONG:
+        return (risk, trials, risk_standard_error(risk, trials))
+
+    (mean, cov) = risk_analytic.tally_moments(e, plan)
+    controls = []
+    competitors = sorted((mean[w] - mean[j], j)
+                         for j in np.flatnonzero(plan.can_win) if j != w)
+    for (margin_mean, j) in competitors[:CONTROL_VARIATE_COMPETITORS]:
+        margin_var = cov[w, w] + cov[j, j] - 2.0 * cov[w, j]
+        if margin_var <= 0.0:
+            continue
+        z = (test_tally[:, w] - test_tally[:, j] - margin_mean) / \
+            math.sqrt(margin_var)
+        controls.extend([z, z * z - 1.0])
+    if len(controls) == 0 or trials <= len(controls) + 1:
+        return (risk, trials, risk_standard_error(risk, trials))
+
+    x = np.column_stack(controls)
+    x_centered = x - x.mean(axis=0)
+    (beta, _, _, _) = np.linalg.lstsq(x_centered, wrong - risk, rcond=None)
+    risk_cv = risk - x.mean(axis=0) @ beta
+    residuals = wrong - risk - x_centered @ beta
+    r2 = 1.0 - (residuals @ residuals) / ((wrong - risk) @ (wrong - risk))
+    if r2 < CONTROL_VARIATE_MIN_R2:
+        return (risk, trials, risk_standard_error(risk, trials))
+    risk_se = math.sqrt(residuals @ residuals /
+                        ((trials - len(controls) - 1) * trials))
+    return (min(max(risk_cv, 0.0), 1.0), trials, risk_se)
+
+
+##############################################################################
+# Importance sampling
+
+# Largest tilt (log of gamma scale factor) applied in any stratum.
+IMPORTANCE_MAX_TILT = 3.0
+
+# If the effective sample size of the weighted trials is below this
+# fraction of the trials, a few trials carry nearly all the weight, and
+# neither the estimate nor its standard error can be trusted; the risk
+# is then computed by compute_risk_vectorized instead.
+IMPORTANCE_MIN_ESS_FRACTION = 0.01
+
+
+def importance_tilts(e, plan, w, j):
+    """
+    Return (strata x votes) array of tilts for compute_risk_importance,
+    moving the posterior toward a reversal between the reported winner
+    w and competitor j: in stratum s the gamma variate for vote k is
+    drawn with scale exp(tilts[s, k]) rather than one.
+
+    A tilt t changes the stratum's contribution N * (D_w - D_j) to the
+    margin by about the sum over k of t_k * g_k, where
+        g_k = N * p_k * ([k == w] - [k == j] - (p_w - p_j))
+    (p = alphas / A, A = sum(alphas)), at a cost (Kullback-Leibler
+    divergence) of about the sum of a_k * t_k**2 / 2.  The cheapest
+    tilts for a given total shift are t_k = -kappa * g_k / a_k, that is
+        t_k = -kappa * (N / A) * ([k == w] - [k == j] - (p_w - p_j));
+    kappa is found by bisection, so that the approximate mean margin
+    of the tilted posterior (with shares proportional to a_k exp(t_k))
+    is zero.
+    """
+
+    totals = plan.alphas.sum(axis=1)
+    p = plan.alphas / totals[:, np.newaxis]
+    indicator = np.zeros(len(plan.votes))
+    indicator[w] = 1.0
+    indicator[j] = -1.0
+    direction = -(plan.nonsample_sizes / totals)[:, np.newaxis] * \
+                (indicator - (p[:, w] - p[:, j])[:, np.newaxis])
+
+    def tilted_margin(kappa):
+        tilts = np.clip(kappa * direction, -IMPORTANCE_MAX_TILT,
+                        IMPORTANCE_MAX_TILT)
+        weighted = plan.alphas * np.exp(tilts)
+        shares = weighted / weighted.sum(axis=1, keepdims=True)
+        return ((plan.alphas[:, w] - plan.alphas[:, j]) +
+                plan.nonsample_sizes * (shares[:, w] - shares[:, j])).sum()
+
+    if tilted_margin(0.0) <= 0.0 or tilted_margin(1e12) > 0.0:
+        return np.zeros(plan.alphas.shape)
+    (lo, hi) = (0.0, 1.0)
+    while tilted_margin(hi) > 0.0:
+        hi *= 2.0
+    for _ in range(60):
+        mid = (lo + hi) / 2.0
+        if tilted_margin(mid) > 0.0:
+            lo = mid
+        else:
+            hi = mid
+    return np.clip(hi * direction, -IMPORTANCE_MAX_TILT, IMPORTANCE_MAX_TILT)
+
+
+def compute_risk_importance(e, plan, trials, rs=None):
+    """
+    Estimate risk by importance sampling, for small risks that plain
+    Monte Carlo would need very many trials to resolve.  Return tuple
+    (risk, number of trials run, standard error, effective sample size).
+
+    The posterior is tilted toward a reversal between the reported
+    winner and its closest competitor (see importance_tilts), by drawing
+    the gamma variates with scales other than one; each trial is then
+    weighted by its likelihood ratio, the exponential of the sum of
+    a log(scale) - g (1 - 1/scale) over its variates g, so the estimate
+    is unbiased.
+
+    The effective sample size (sum of weights)**2 / (sum of squared
+    weights) is also returned.  It is near trials when little tilting
+    is needed, and falls as the tilt grows.  If it falls below
+    IMPORTANCE_MIN_ESS_FRACTION of the trials, the weights are dominated
+    by a handful of trials, so a warning is given and the risk is
+    computed by compute_risk_vectorized instead.
+    """
+
+    if rs == None:
+        rs = audit.auditRandomState
+    w = plan.ro_index
+    if w < 0 or not plan.can_win[w] or np.count_nonzero(plan.can_win) < 2:
+        (risk, trials_done) = compute_risk_vectorized(e, plan, trials, rs)
+        return (risk, trials_done, risk_standard_error(risk, trials_done),
+                float(trials_done))
+
+    (mean, cov) = risk_analytic.tally_moments(e, plan)
+    (_, j) = min((mean[w] - mean[j], j)
+                 for j in np.flatnonzero(plan.can_win) if j != w)
+    tilts = importance_tilts(e, plan, w, j)
+
+    test_tally = np.zeros((trials, len(plan.votes)))
+    log_weights = np.zeros(trials)
+    for (alphas, nonsample_size, tilt) in \
+            zip(plan.alphas, plan.nonsample_sizes, tilts):
+        scales = np.exp(tilt)
+        g = rs.gamma(alphas, scales, size=(trials, len(alphas)))
+        log_weights += (alphas * tilt).sum() - g @ (1.0 - 1.0 / scales)
+        test_tally += alphas
+        test_tally += g / g.sum(axis=1, keepdims=True) * nonsample_size
+    winners = outcomes.compute_outcome_batch(e, plan.cid, test_tally,
+                                             plan.can_win)
+    weights = np.exp(log_weights)
+    weighted_wrong = np.where(winners != plan.ro_index, weights, 0.0)
+    risk = weighted_wrong.mean()
+    risk_se = weighted_wrong.std(ddof=1) / math.sqrt(trials)
+    ess = weights.sum() ** 2 / (weights ** 2).sum()
+    if ess < IMPORTANCE_MIN_ESS_FRACTION * trials:
+        utils.mywarning("Importance sampling for contest {} has effective "
+                        "sample size {:.0f} of {} trials (risk {:.3g}); "
+                        "using the vectorized engine instead."
+                        .format(plan.cid, ess, trials, risk))
+        (risk, trials_done) = compute_risk_vectorized(e, plan, trials, rs)
+        return (risk, trials_done, risk_standard_error(risk, trials_done),
+                float(trials_done))
+    return (min(risk, 1.0), trials, risk_se, ess)
+
+
+##############################################################################
+# Sequential (adaptive) risk estimation
+
+def risk_confidence(e, mid):
+    """
+    Return confidence level used by the adaptive engine for measurement mid:
+    "Param 2" of the measurement if given, else e.risk_confidence.
+    (audit.check_audit_spec checks that Param 2 is a valid level.)
+    """
+
+    params = e.risk_measurement_parameters_m.get(mid, ("", ""))
+    if len(params) > 1 and params[1].strip() != "":
+        return float(params[1])
+    return e.risk_confidence
+
+
+def risk_interval(wrong_outcome_count, trials, confidence):
+    """
+    Return (lo, hi), a Wilson score confidence interval at the given
+    confidence level for the risk, after observing wrong_outcome_count
+    wrong outcomes in the given number of trials.
+    """
+
+    z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2.0)
+    p = wrong_outcome_count / trials
+    denominator = 1.0 + z * z / trials
+    center = (p + z * z / (2.0 * trials)) / denominator
+    half_width = (z / denominator) * \
+                 math.sqrt(p * (1.0 - p) / trials + z * z / (4.0 * trials * trials))
+    return (max(0.0, center - half_width), min(1.0, center + half_width))
+
+
+def risk_look_confidence(confidence, trials, chunk_trials):
+    """
+    Return confidence level for each of the intervals computed (one
+    after each chunk of chunk_trials trials) by iter_risk_estimates,
+    when at most trials trials are run, so that a decision to stop is
+    right with the given confidence overall.  Since the run may stop
+    after any chunk, the chance of error 1 - confidence is split evenly
+    (Bonferroni) over the ceil(trials / chunk_trials) intervals.
+    """
+
+    looks = max(1, math.ceil(trials / chunk_trials))
+    return 1.0 - (1.0 - confidence) / looks
+
+
+def risk_decision_settled(e, mid, lo, hi):
+    """
+    Return True if the status that compute_statuses would give mid
+    (Passed, Upset, or Open) is the same for every risk in [lo, hi].
+    """
+
+    limit = e.risk_limit_m[mid]
+    upset = e.risk_upset_m[mid]
+    return hi < limit or lo > upset or (limit <= lo and hi <= upset)
+
+
+class RiskProgress(object):
+    """
+    Running state of a risk computation done in chunks of trials, as
+    yielded by iter_risk_estimates after each chunk.
+
+    Attributes:
+        mids                the measurements being computed
+        trials              the most trials that will be run
+        trials_done         trials run so far
+        wrong_outcome_count trials so far with a wrong outcome
+        risk                running estimate of the risk
+        lo, hi              confidence interval for the risk (see
+                            risk_interval), at the highest confidence
+                            level required by any of mids (as adjusted
+                            by risk_look_confidence)
+        settled             True if the status of every measurement in
+                            mids is known (see risk_decision_settled)
+        done                True if no more trials will be run (settled,
+                            or all trials run)
+    """
+
+    pass
+
+
+def iter_risk_estimates(e, mids, plan, trials, rs=None):
+    """
+    Generator form of the risk computation for the group mids of
+    measurements (with posterior plan): run at most trials trials, in
+    chunks of e.risk_chunk_trials, yielding a RiskProgress after each
+    chunk.  The confidence intervals are at the levels given by
+    risk_look_confidence, so that stopping at the first settled
+    progress gives the right status for each mid with confidence
+    risk_confidence(e, mid), however many chunks are run.
+
+    The caller decides when to stop: it may stop iterating as soon as
+    the yielded progress is settled (as compute_risk_adaptive does), or
+    at any other point (say, on an operator's request); the last
+    progress yielded is then a valid estimate from the trials run so far.
+    Each progress yielded is a new object, so the caller may keep them
+    (say, to plot the estimate against the trials run).
+    """
+
+    confidence_m = {mid: risk_look_confidence(risk_confidence(e, mid),
+                                              trials, e.risk_chunk_trials)
+                    for mid in mids}
+    confidence = max(confidence_m.values())
+    trials_done = 0
+    wrong_outcome_count = 0
+    while trials_done < trials:
+        chunk_trials = min(e.risk_chunk_trials, trials - trials_done)
+        wrong_outcome_count += count_wrong_outcomes(e, plan, chunk_trials, rs)
+        trials_done += chunk_trials
+        progress = RiskProgress()
+        progress.mids = mids
+        progress.trials = trials
+        progress.trials_done = trials_done
+        progress.wrong_outcome_count = wrong_outcome_count
+        progress.risk = wrong_outcome_count / trials_done
+        (progress.lo, progress.hi) = risk_interval(wrong_outcome_count,
+                                                   trials_done, confidence)
+        progress.settled = \
+            all([risk_decision_settled(e, mid,
+                                       *risk_interval(wrong_outcome_count,
+                                                      trials_done,
+                                                      confidence_m[mid]))
+                 for mid in mids])
+        progress.done = progress.settled or trials_done == trials
+        yield progress
+
+
+def compute_risk_adaptive(e, mids, plan, trials, rs=None):
+    """
+    Like compute_risk_vectorized, but trials are run in chunks of
+    e.risk_chunk_trials (see iter_risk_estimates), and we stop as soon
+    as confidence intervals (see risk_interval) for the risk show that
+    the status of every measurement in mids is settled, with confidence
+    for each mid given by risk_confidence(e, mid) (each interval being
+    at the higher level given by risk_look_confidence, since the run
+    may stop after any chunk).  At most trials trials are run.
+
+    After each chunk, e.risk_progress_callback (if not None) is called
+    with e and the RiskProgress.  If the computation is interrupted
+    (KeyboardInterrupt) after at least one chunk, the estimate from the
+    trials run so far is kept, and mids are added to e.interrupted_mids
+    (so that audit.compute_statuses leaves them Open).
+    """
+
+    progress = None
+    try:
+        for progress in iter_risk_estimates(e, mids, plan, trials, rs):
+            if e.risk_progress_callback != None:
+                e.risk_progress_callback(e, progress)
+            if progress.settled:
+                break
+    except KeyboardInterrupt:
+        if progress == None:
+            raise
+        utils.mywarning("Risk computation for {} interrupted; keeping "
+                        "estimate {:.5f} from {} trials."
+                        .format(" ".join(mids), progress.risk,
+                                progress.trials_done))
+        e.interrupted_mids.update(mids)
+    return (progress.risk, progress.trials_done)
+
+
+# Least number of seconds between progress lines printed by
+# print_risk_progress for the same measurements.
+RISK_PROGRESS_INTERVAL = 1.0
+
+# Time of the last progress line printed by print_risk_progress.
+risk_progress_printed = 0.0
+
+
+def print_risk_progress(e, progress):
+    """
+    Callback for e.risk_progress_callback (set by the --risk_progress
+    command-line option): print running risk estimate, its confidence
+    interval, and the trials done, at most once every
+    RISK_PROGRESS_INTERVAL seconds, and when the computation is done.
+    """
+
+    global risk_progress_printed
+    now = time.perf_counter()
+    if progress.done or now - risk_progress_printed >= RISK_PROGRESS_INTERVAL:
+        risk_progress_printed = now
+        print("    {} Risk={:.5f} ({:.5f} to {:.5f}) Trials={}/{}{}"
+              .format(" ".join(progress.mids), progress.risk, progress.lo,
+                      progress.hi, progress.trials_done, progress.trials,
+                      " settled" if progress.settled else ""),
+              flush=True)
+
+
+def measurement_random_state(e, mid):
+    """
+    Return a new numpy.random.RandomState object giving an independent
+    stream of random numbers for measurement mid.  It is seeded from the
+    SHA256 hash of e.audit_seed and mid, so the stream depends only on
+    those two values, not on what other measurements have drawn.
+    (If e.audit_seed is None, the stream is seeded from the clock.)
+    """
+
+    if e.audit_seed == None:
+        return utils.RandomState(None)
+    seed_string = "{}:{}".format(e.audit_seed, mid)
+    seed = int(hashlib.sha256(seed_string.encode()).hexdigest(), 16)
+    return utils.RandomState(seed)
+
+
+def compute_risks(e, st, trials=None, mids=None):
+    """
+    Compute risks for all measurements (or just those in mids, if
+    given), for current sample.
+
+    Measurements are evaluated in groups (see measurement_groups), so 
+    the posterior of each contest is simulated once per engine rather
+    than once per measurement.
+
+    If e.n_workers is None (and neither the risk cache nor incremental
+    stages are in use), groups are done one after another, all drawing
+    from audit.auditRandomState.
+    Otherwise each group draws from its own stream (see
+    measurement_random_state, applied to the group's first mid), and the
+    groups are farmed out to a pool of e.n_workers processes (if
+    e.n_workers > 1).  The risks are then the same whatever the number
+    of workers or the order in which the groups finish.
+
+    If e.use_risk_cache is True, groups whose inputs are unchanged since
+    they were last computed (see risk_cache_key) take their risks from
+    the risk cache file rather than being recomputed, and newly computed
+    risks are added to it.  Since the risk must then depend only on
+    those inputs, each group draws from its own stream, as above.
+    The same goes when e.incremental is True, so that a risk doesn't
+    depend on which other risks were carried forward rather than computed.
+
+    Risks computed serially by the "adaptive" engine may be interrupted
+    (see compute_risk_adaptive); their partial estimates are kept, but
+    not added to the risk cache.
+    """
+
+    groups = measurement_groups(e, mids)
+    e.interrupted_mids = set()
+
+    if e.use_risk_cache:
+        cache = read_risk_cache(e)
+        key_g = {tuple(mids): risk_cache_key(e, mids, st, trials)
+                 for mids in groups}
+        uncached_groups = []
+        for mids in groups:
+            key = key_g[tuple(mids)]
+            if key in cache:
+                for mid in mids:
+                    e.risk_tm[e.stage_time][mid] = cache[key]["risk"]
+                    e.trials_tm[e.stage_time][mid] = cache[key]["trials"]
+                    e.risk_se_tm[e.stage_time][mid] = \
+                        cache[key].get("se", risk_standard_error(
+                            cache[key]["risk"], cache[key]["trials"]))
+                    e.ess_tm[e.stage_time][mid] = \
+                        cache[key].get("ess", float(cache[key]["trials"]))
+                timings.add_timing(e, "risk_cache_hit", mids)
+            else:
+                uncached_groups.append(mids)
+        groups = uncached_groups
+
+    # compile posterior plans once per contest, for all its measurements
+    plan_c = {}
+    with timings.timed(e, "compile_posterior_plans") as record:
+        for group_mids in groups:
+            cid = e.cid_m[group_mids[0]]
+            if cid not in plan_c:
+                plan_c[cid] = compile_posterior_plan(e, cid, st)
+        record["Strata"] = sum(len(plan.strata) for plan in plan_c.values())
+
+    if e.n_workers == None and not (e.use_risk_cache or e.incremental):
+        for mids in groups:
+            plan = plan_c[e.cid_m[mids[0]]]
+            with timings.timed(e, "compute_risk", mids,
+                               Strata=len(plan.strata)) as record:
+                compute_group_risk(e, mids, st, trials, plan=plan)
+                record["Trials"] = e.trials_tm[e.stage_time][mids[0]]
+    elif e.n_workers == None or e.n_workers <= 1:
+        for mids in groups:
+            plan = plan_c[e.cid_m[mids[0]]]
+            with timings.timed(e, "compute_risk", mids,
+                               Strata=len(plan.strata)) as record:
+                compute_group_risk(e, mids, st, trials,
+                                   measurement_random_state(e, mids[0]),
+                                   plan)
+                record["Trials"] = e.trials_tm[e.stage_time][mids[0]]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=e.n_workers,
+                initializer=init_risk_worker,
+                initargs=(e, st, trials, plan_c)) as executor:
+            results = executor.map(compute_risk_in_worker, groups)
+            for (mids, (risk, trials_done, risk_se, ess, wall, cpu)) \
+                    in zip(groups, results):
+                for mid in mids:
+                    e.risk_tm[e.stage_time][mid] = risk
+                    e.trials_tm[e.stage_time][mid] = trials_done
+                    e.risk_se_tm[e.stage_time][mid] = risk_se
+                    e.ess_tm[e.stage_time][mid] = ess
+                timings.add_timing(e, "compute_risk", mids, wall, cpu,
+                                   Trials=trials_done,
+                                   Strata=len(plan_c[e.cid_m[mids[0]]].strata))
+
+    if e.use_risk_cache and len(groups) > 0:
+        for mids in groups:
+            if mids[0] in e.interrupted_mids:
+                continue        # partial estimate; don't reuse it
+            cache[key_g[tuple(mids)]] = \
+                {"risk": e.risk_tm[e.stage_time][mids[0]],
+                 "trials": e.trials_tm[e.stage_time][mids[0]],
+                 "se": e.risk_se_tm[e.stage_time][mids[0]],
+                 "ess": e.ess_tm[e.stage_time][mids[0]]}
+        write_risk_cache(e, cache)
+
+
+# State of a worker process in the pool used by compute_risks.
+worker_args = None
+
+
+def init_risk_worker(e, st, trials, plan_c):
+    """ Initialize worker process in pool used by compute_risks. """
+
+    global worker_args
+    worker_args = (e, st, trials, plan_c)
+
+
+def compute_risk_in_worker(mids):
+    """ 
+    Compute risk for group mids of measurements, in a worker process.
+    Return tuple (risk, number of trials run, standard error of risk,
+    effective sample size, wall seconds, CPU seconds).
+    """
+
+    (e, st, trials, plan_c) = worker_args
+    with timings.timed(e, "compute_risk", mids) as record:
+        risk = compute_group_risk(e, mids, st, trials,
+                                  measurement_random_state(e, mids[0]),
+                                  plan_c[e.cid_m[mids[0]]])
+    return (risk, e.trials_tm[e.stage_time][mids[0]],
+            e.risk_se_tm[e.stage_time][mids[0]],
+            e.ess_tm[e.stage_time][mids[0]],
+            record["Wall seconds"], record["CPU seconds"])
+
+
+##############################################################################
+# Risk cache
+#
+# The risk cache is a json file in 3-audit/34-audit-output mapping the key
+# (see risk_cache_key) of a group of measurements to the risk computed
+# for it and the number of trials run.  It lets a stage be re-run (say,
+# after a crash) without recomputing risks whose inputs haven't changed.
+
+def risk_cache_pathname(e):
+    """ Return pathname of risk cache file for election e. """
+
+    dirpath = os.path.join(multi.ELECTIONS_ROOT,
+                           e.election_dirname,
+                           "3-audit",
+                           "34-audit-output")
+    return os.path.join(dirpath, "audit-output-risk-cache.json")
+
+
+def read_risk_cache(e):
+    """ Return dict read from risk cache file, or {} if there is none. """
+
+    pathname = risk_cache_pathname(e)
+    if not os.path.exists(pathname):
+        return {}
+    try:
+        with open(pathname, "r") as file:
+            return json.load(file)
+    except ValueError:
+        utils.mywarning("Ignoring unreadable risk cache file `{}`."
+                        .format(pathname))
+        return {}
+
+
+def write_risk_cache(e, cache):
+    """ 
+    Write dict cache to risk cache file.  The file is replaced 
+    atomically, so a crash can't leave a partly-written cache.
+    """
+
+    pathname = risk_cache_pathname(e)
+    os.makedirs(os.path.dirname(pathname), exist_ok=True)
+    with open(pathname + ".tmp", "w") as file:
+        json.dump(cache, file, indent=2, sort_keys=True)
+    os.replace(pathname + ".tmp", pathname)
+
+
+# Attributes of e (other than those of the measurements and the contest)
+# that may change the risk an engine computes, and so must be part of the
+# risk cache key.  A new engine setting belongs here too.
+RISK_ENGINE_SETTINGS = ["pseudocount_base",
+                        "pseudocount_match",
+                        "audit_seed",
+                        "risk_chunk_trials",
+                        "risk_confidence",
+                        "analytic_min_stratum_size",
+                        "risk_memory_budget",
+                        "risk_float32"]
+
+
+def risk_cache_key(e, mids, st, trials=None):
+    """
+    Return key (a SHA256 hex digest) for the risk of group mids of
+    measurements, as computed from sample tallies st.
+
+    The key covers everything the risk depends on: the sample tallies
+    st[e.stage_time][cid] and reported stratum sizes e.rn_cpr[cid] for
+    the contest, its reported outcome and outcome rule, the 
+    pseudocounts, the audit seed, the number of trials, and the mids
+    with their methods, parameters, and risk limits and upset thresholds
+    (which the "adaptive" engine uses to decide when to stop), as well
+    as the settings of the engines (the attributes of e listed in
+    RISK_ENGINE_SETTINGS).
+    """
+
+    if trials == None:
+        trials = e.n_trials
+    cid = e.cid_m[mids[0]]
+    sn_cpra = st[e.stage_time][cid]
+    rn_cpr = e.rn_cpr[cid]
+    inputs = {"cid": cid,
+              "sn_cpra": sorted([pbcid, list(rv), list(av), sn_cpra[pbcid][rv][av]]
+                                for pbcid in sn_cpra
+                                for rv in sn_cpra[pbcid]
+                                for av in sn_cpra[pbcid][rv]),
+              "rn_cpr": sorted([pbcid, list(rv), rn_cpr[pbcid][rv]]
+                               for pbcid in rn_cpr
+                               for rv in rn_cpr[pbcid]),
+              "ro": list(e.ro_c[cid]),
+              "votes": sorted(list(vote) for vote in e.votes_c[cid]),
+              "contest_type": e.contest_type_c[cid],
+              "trials": trials,
+              "settings": {setting: getattr(e, setting)
+                           for setting in RISK_ENGINE_SETTINGS},
+              "mids": [[mid,
+                        e.risk_method_m[mid],
+                        risk_engine(e, mid),
+                        list(e.risk_measurement_parameters_m[mid]),
+                        e.risk_limit_m[mid],
+                        e.risk_upset_m[mid]]
+                       for mid in mids]}
+    inputs_string = json.dumps(inputs, sort_keys=True)
+    return hashlib.sha256(inputs_string.encode()).hexdigest()
 
 
 def compute_slack_p(e):
@@ -146,7 +1129,7 @@ def compute_slack_p(e):
             slack_p[pbcid] -= e.sn_tcpr[e.stage_time][cid][pbcid][rv]
     return slack_p
 
-def compute_risk_with_tweak(e, mid, slack_p, tweak_p, trials):
+def compute_risk_with_tweak(e, mid, slack_p, tweak_p, trials, crn=None):
     """
     Return computed risk for given mid 
     if sample sizes were tweaked (increased).
@@ -155,38 +1138,55 @@ def compute_risk_with_tweak(e, mid, slack_p, tweak_p, trials):
     to increase sample size by in each pbcid.  We must have
         0 <= tweak_p[pbcid] <= slack_p[pbcid]
     for all pbcids.
+
+    If crn is given, it is a dict of common random numbers (see
+    common_random_numbers) shared by all the tweaks being compared,
+    and the risk is computed from them (with crn["trials"] trials).
+
+    The risk is hypothetical, so it is not recorded in e.risk_tm (nor
+    are its trials and so on recorded); e is left as it was.
     """
 
     for pbcid in e.pbcids:
         assert 0 <= tweak_p[pbcid] <= slack_p[pbcid]
 
     cid = e.cid_m[mid]
+    sn_tcpra = tweaked_sn_tcpra(e, cid, tweak_p)
+    plan = compile_posterior_plan(e, cid, sn_tcpra)
 
-    # Compute sn_tcp, as it is not otherwise defined.
-    # (Perhaps this should be computed elsewhere/earlier?)
-    sn_tcp = {}
-    sn_tcp[e.stage_time] = {}
-    sn_tcp[e.stage_time][cid] = {}
-    for pbcid in e.pbcids:
-        sn_tcp[e.stage_time][cid][pbcid] = 0
-        for rv in e.sn_tcpra[e.stage_time][cid][pbcid]:
-            for av in e.sn_tcpra[e.stage_time][cid][pbcid][rv]:
-                sn_tcp[e.stage_time][cid][pbcid] += \
-                    e.sn_tcpra[e.stage_time][cid][pbcid][rv][av]
+    if crn != None:
+        return count_wrong_outcomes_crn(e, plan, crn) / crn["trials"]
+    (risk, _, _, _) = simulate_group_risk(e, [mid], plan, trials)
+    return risk
 
-    # compute sn_tcpra as "tweaked" version of e.sn_tcpra
-    sn_tcpra = copy.deepcopy(e.sn_tcpra)
-    for pbcid in e.pbcids:
-        for rv in sn_tcpra[e.stage_time][cid][pbcid]:
-            for av in e.sn_tcpra[e.stage_time][cid][pbcid][rv]:
-                sn_tcpra[e.stage_time][cid][pbcid][rv][av] += \
-                    tweak_p[pbcid] * sn_tcpra[e.stage_time][cid][pbcid][rv][av] / \
-                                     sn_tcp[e.stage_time][cid][pbcid]
 
-    return compute_risk(e, mid, sn_tcpra, trials)
+def tweaked_sn_tcpra(e, cid, tweak_p):
+    """
+    Return sample tallies for contest cid as they would be if the sample
+    in each pbcid were increased by tweak_p[pbcid], with each count in
+    the pbcid scaled up in proportion.
+
+    The result has the same structure as e.sn_tcpra, but contains only
+    the current stage and contest cid (all that compute_risk looks at),
+    so nothing else in e.sn_tcpra is copied.  No (reported, actual)
+    vote pair is added, so the posterior plan compiled from the result
+    has the same votes, in the same order, as that for e.sn_tcpra.
+    """
+
+    sn_cpra = e.sn_tcpra[e.stage_time][cid]
+    tweaked_cpra = {}
+    for pbcid in sn_cpra:
+        sn_pra = sn_cpra[pbcid]
+        tweak = tweak_p.get(pbcid, 0)
+        sample_size = sum([sum(sn_pra[rv].values()) for rv in sn_pra])
+        tweaked_cpra[pbcid] = \
+            {rv: {av: count + tweak * count / sample_size
+                  for (av, count) in sn_pra[rv].items()}
+             for rv in sn_pra}
+    return {e.stage_time: {cid: tweaked_cpra}}
 
 
-def compute_risks_with_tweak(e, slack_p, tweak_p, trials):
+def compute_risks_with_tweak(e, slack_p, tweak_p, trials, crn=None):
     """
     Compute bayes risks for *all* measurements for given 
     tweak_p (sample size increments per pbcid).
@@ -199,6 +1199,13 @@ def compute_risks_with_tweak(e, slack_p, tweak_p, trials):
     In one planning strategy, based on random walks in tweak space,
     the value of "trials" might always be equal to one.  In this
     case, risk_m[mid] is always 0 or 1.  This is OK.
+
+    When comparing several tweaks, pass the same crn (as made by 
+    common_random_numbers(e, trials)) to each call, so that all
+    tweaks are evaluated against the same underlying random draws;
+    differences between their risks then reflect the tweaks rather
+    than Monte Carlo noise.  (No planner uses this yet; planner.py
+    plans without evaluating risks.)
     """
 
     risk_m = {}
@@ -207,10 +1214,82 @@ def compute_risks_with_tweak(e, slack_p, tweak_p, trials):
                                               mid,
                                               slack_p,
                                               tweak_p,
-                                              trials)
+                                              trials,
+                                              crn)
     return risk_m
 
 
+##############################################################################
+# Common random numbers (for comparing tweaks)
+
+def common_random_numbers(e, trials, rs=None):
+    """
+    Return a dict crn of "common random numbers" for evaluating the 
+    risks of many tweaks (see compute_risks_with_tweak) against the
+    same underlying randomness.
+
+    A Gamma(a+d) variate is the sum of independent Gamma(a) and 
+    Gamma(d) variates.  Since a tweak only increases the Dirichlet
+    hyperparameters (sample counts), we draw here, once, the gamma 
+    matrices for the untweaked posterior plan of each contest; every 
+    tweak reuses these, adding only gamma increments for its extra
+    hyperparameter mass, which are drawn from a stream restarted from
+    the same seed for every tweak.
+
+        crn["trials"]     number of trials
+        crn["seed"]       seed for the stream of increments
+        crn["plan_c"]     cid -> untweaked PosteriorPlan
+        crn["gammas_c"]   cid -> list, one per stratum of the plan, of
+                          (trials x votes) gamma matrices
+
+    This relies on a tweak only scaling up the counts already in the
+    sample (see tweaked_sn_tcpra), so that every tweaked plan has the
+    same strata and votes as the untweaked one.  The crn are for one
+    stage only: a later stage's sample may contain votes not seen
+    before, changing the plan's votes and hence the draw order (see
+    PosteriorPlan).
+    """
+
+    if rs == None:
+        rs = audit.auditRandomState
+    crn = {"trials": trials,
+           "seed": int(rs.randint(2**31)),
+           "plan_c": {},
+           "gammas_c": {}}
+    for mid in e.mids:
+        cid = e.cid_m[mid]
+        if cid not in crn["plan_c"]:
+            plan = compile_posterior_plan(e, cid, e.sn_tcpra)
+            crn["plan_c"][cid] = plan
+            crn["gammas_c"][cid] = [gamma_matrix(alphas, trials, rs)
+                                    for alphas in plan.alphas]
+    return crn
+
+
+def count_wrong_outcomes_crn(e, plan, crn):
+    """
+    Like count_wrong_outcomes, but draw the posterior for plan (a
+    tweaked version of crn["plan_c"][plan.cid]) from the common random
+    numbers crn, with crn["trials"] trials.
+    """
+
+    base_plan = crn["plan_c"][plan.cid]
+    assert plan.strata == base_plan.strata and plan.votes == base_plan.votes
+    increment_rs = np.random.RandomState(crn["seed"])
+    trials = crn["trials"]
+    test_tally = np.zeros((trials, len(plan.votes)))
+    for (alphas, base_alphas, nonsample_size, base_gammas) in \
+        zip(plan.alphas, base_plan.alphas, plan.nonsample_sizes,
+            crn["gammas_c"][plan.cid]):
+        g = base_gammas + gamma_matrix(np.maximum(alphas - base_alphas, 0.0),
+                                       trials, increment_rs)
+        test_tally += alphas
+        test_tally += g / g.sum(axis=1, keepdims=True) * nonsample_size
+    winners = outcomes.compute_outcome_batch(e, plan.cid, test_tally,
+                                             plan.can_win)
+    return int(np.count_nonzero(winners != plan.ro_index))
+
+
 def tweak_all(e, mid):   # unused ??
     """
     Test routine to try all possible tweaks.  That is,
@@ -53,6 +53,13 @@ def write_intermediate_saved_state(e):
     ss["sn_tp"] = e.sn_tp             # sample sizes, by stage and pbcid
     ss["status_tm"] = e.status_tm     # measurement statuses, by stage and mid
     ss["plan_tp"] = e.plan_tp         # plan for next stage of audit
+    ss["risk_tm"] = e.risk_tm         # measured risks, by stage and mid
+    ss["trials_tm"] = e.trials_tm     # trials run, by stage and mid
+    ss["risk_se_tm"] = e.risk_se_tm   # standard errors of risks
+    ss["ess_tm"] = e.ess_tm           # effective sample sizes
+    ss["sn_digest_tcp"] = e.sn_digest_tcp   # sample tally digests
+    ss["interrupted_mids"] = sorted(e.interrupted_mids)
+                                      # mids with partial risk estimates
 
     write_state(e, ss)
 
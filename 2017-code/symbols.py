@@ -0,0 +1,116 @@
+# symbols.py
+# python3
+
+"""
+Symbol tables giving dense integer codes to the ids and votes of an
+election.
+
+The election data model (multi.Election) keys its dicts by strings
+(cids, pbcids, bids) and by votes (tuples of selid strings).  Hashing
+and comparing those is what most loops over ballots spend their time
+on.  A SymbolTable assigns codes 0, 1, 2, ... to the distinct symbols
+it is given, so that loops over ballots can work on numpy arrays of
+codes instead, translating back to the symbols only for input and
+output.
+
+The tables built at load time (by build_symbol_tables, called from
+reported.finish_reported) are:
+    e.bid_symbols_p     for each pbcid, its ballot ids in the order of
+                        e.bids_p[pbcid] (so a bid's code is its position
+                        in the collection); this is e.bids_p[pbcid]
+                        itself if that is a manifest.Manifest with
+                        distinct ballot ids
+    e.vote_symbols_c    for each cid, its votes (sorted, as tallies and
+                        posterior plans order them); votes first seen
+                        later (say, ("-NoSuchContest",) for ballots
+                        without the contest, or audited votes) get the
+                        next codes
+"""
+
+import numpy as np
+
+import manifest
+
+
+class SymbolTable(object):
+    """
+    Two-way mapping between distinct symbols (any hashable values) and
+    dense integer codes 0, 1, ..., len(table)-1, given in the order
+    the symbols were added.
+    """
+
+    def __init__(self, symbols=()):
+
+        self.symbols = []               # code -> symbol
+        self.codes = {}                 # symbol -> code
+        for symbol in symbols:
+            self.add(symbol)
+
+    def __len__(self):
+
+        return len(self.symbols)
+
+    def __contains__(self, symbol):
+
+        return symbol in self.codes
+
+    def __iter__(self):
+
+        return iter(self.symbols)
+
+    def add(self, symbol):
+        """ Return code for symbol, giving it the next code if it is new. """
+
+        code = self.codes.get(symbol)
+        if code == None:
+            code = len(self.symbols)
+            self.codes[symbol] = code
+            self.symbols.append(symbol)
+        return code
+
+    def code(self, symbol):
+        """ Return code for symbol (which must be in the table). """
+
+        return self.codes[symbol]
+
+    def get(self, symbol, default=None):
+        """ Return code for symbol, or default if it is not in the table. """
+
+        return self.codes.get(symbol, default)
+
+    def symbol(self, code):
+        """ Return symbol with the given code. """
+
+        return self.symbols[code]
+
+    def encode(self, symbols, default=-1):
+        """
+        Return numpy array of codes for the given symbols, with default
+        for those not in the table.
+        """
+
+        return np.fromiter((self.codes.get(symbol, default)
+                            for symbol in symbols),
+                           dtype=np.int64)
+
+    def decode(self, codes):
+        """ Return list of the symbols with the given codes. """
+
+        return [self.symbols[code] for code in codes]
+
+
+def build_symbol_tables(e):
+    """
+    Build the symbol tables of e (see above) from e.pbcids, e.bids_p,
+    and e.votes_c.
+    """
+
+    e.bid_symbols_p = {}
+    for pbcid in e.pbcids:
+        bids = e.bids_p.get(pbcid, [])
+        if isinstance(bids, manifest.Manifest) and bids.distinct():
+            e.bid_symbols_p[pbcid] = bids
+        else:
+            e.bid_symbols_p[pbcid] = SymbolTable(bids)
+    e.vote_symbols_c = {cid: SymbolTable(sorted(e.votes_c.get(cid, {})))
+                        for cid in e.cids}
@@ -20,8 +20,10 @@ import audit_orders
 import election_spec
 import outcomes
 import reported
+import symbols
 import syn
 import utils
+import vote_store
 import write_csv
 
 
@@ -323,10 +325,9 @@ def generate_rv_cpb(e, synpar):
 
 def compute_reported_stats(e, synpar):
 
-    reported.compute_rn_cpr(e)
-    reported.compute_rn_c(e)
-    reported.compute_rn_p(e)
-    reported.compute_rn_cr(e)
+    symbols.build_symbol_tables(e)
+    vote_store.build_reported_vote_store(e)
+    reported.compute_reported_counts(e)
     outcomes.compute_ro_c(e)
 
 
@@ -0,0 +1,206 @@
+# test_election_cache.py
+# python3
+
+import io
+import numpy as np
+import os
+import pickle
+import shutil
+import tempfile
+import types
+
+import election_cache
+import multi
+import reported
+import utils
+
+
+def copy_election(elections_root, election_dirname="C0"):
+    """
+    Copy the election spec and reported data of the named election from
+    multi.ELECTIONS_ROOT to elections_root.
+    """
+
+    for dirname in ["1-election-spec", "2-reported"]:
+        shutil.copytree(os.path.join(multi.ELECTIONS_ROOT,
+                                     election_dirname, dirname),
+                        os.path.join(elections_root,
+                                     election_dirname, dirname))
+
+
+def read_election(election_dirname="C0"):
+    """
+    Return (e, output, fresh): the Election read by
+    election_cache.read_election (None if reading stopped with an
+    error), the output printed through utils.myprint, and whether the
+    reported data was read afresh rather than loaded from the cache.
+    """
+
+    e = multi.Election()
+    e.election_dirname = election_dirname
+    reads = []
+    read_reported = reported.read_reported
+
+    def counting_read_reported(e):
+        reads.append(e)
+        read_reported(e)
+
+    output = io.StringIO()
+    saved_stdout = utils.myprint_files.pop("stdout")
+    utils.myprint_files["test"] = output
+    reported.read_reported = counting_read_reported
+    try:
+        election_cache.read_election(e)
+    except SystemExit:
+        e = None
+    finally:
+        reported.read_reported = read_reported
+        del utils.myprint_files["test"]
+        utils.myprint_files["stdout"] = saved_stdout
+    return (e, output.getvalue(), len(reads) > 0)
+
+
+def cache_key(election_dirname="C0"):
+    """ Return key the election cache file was written under. """
+
+    e = multi.Election()
+    e.election_dirname = election_dirname
+    with open(election_cache.election_cache_pathname(e), "rb") as file:
+        return pickle.load(file)["key"]
+
+
+def outcomes_pathname(election_dirname="C0"):
+
+    return os.path.join(multi.ELECTIONS_ROOT, election_dirname,
+                        "2-reported", "23-reported-outcomes.csv")
+
+
+def in_election_copy(test):
+    """
+    Run test (a function of no arguments) with multi.ELECTIONS_ROOT set
+    to a temporary copy of elections/C0, and with no warnings given so
+    far (since the reading code stops on any warning).
+    """
+
+    saved_elections_root = multi.ELECTIONS_ROOT
+    saved_warnings_given = utils.warnings_given
+    with tempfile.TemporaryDirectory() as elections_root:
+        copy_election(elections_root)
+        multi.ELECTIONS_ROOT = elections_root
+        utils.warnings_given = 0
+        try:
+            test()
+        finally:
+            multi.ELECTIONS_ROOT = saved_elections_root
+            utils.warnings_given = saved_warnings_given
+
+
+def test_election_cache_hit():
+    """
+    Check that a second read of an unchanged election loads it from the
+    cache, with the same state, and prints the same output.
+    """
+
+    def test():
+        (e, output, fresh) = read_election()
+        assert fresh
+        (cached_e, cached_output, fresh) = read_election()
+        assert not fresh
+        assert cached_output == output
+        assert cached_e.rn_cpr == e.rn_cpr
+        assert cached_e.ro_c == e.ro_c
+        for cid in e.cids:
+            for pbcid in e.possible_pbcid_c[cid]:
+                assert np.array_equal(cached_e.rv_code_cp[cid][pbcid],
+                                      e.rv_code_cp[cid][pbcid])
+
+    in_election_copy(test)
+
+
+def test_election_cache_input_changed():
+    """
+    Check that changing an input file makes the next read start afresh
+    and rewrite the cache, which the read after that then uses.
+    """
+
+    def test():
+        read_election()
+        key = cache_key()
+        with open(outcomes_pathname(), "w") as file:
+            file.write("Contest,Winner(s)\ncon2,sel1\ncon1,sel3\n")
+        (e, output, fresh) = read_election()
+        assert fresh
+        assert list(e.ro_c) == ["con2", "con1"]
+        assert cache_key() != key
+        (e, output, fresh) = read_election()
+        assert not fresh
+
+    in_election_copy(test)
+
+
+def test_election_cache_module_changed():
+    """
+    Check that changing the source of a reader module makes the next
+    read start afresh.  (The change is simulated by pointing the
+    reported module's entry in election_cache.READER_MODULES at an
+    edited copy of its source.)
+    """
+
+    def test():
+        read_election()
+        key = cache_key()
+        saved_reader_modules = election_cache.READER_MODULES
+        with tempfile.TemporaryDirectory() as dirpath:
+            pathname = os.path.join(dirpath, "reported.py")
+            shutil.copyfile(reported.__file__, pathname)
+            with open(pathname, "a") as file:
+                file.write("\n# edited\n")
+            edited = types.SimpleNamespace(__name__="reported",
+                                           __file__=pathname)
+            election_cache.READER_MODULES = \
+                [edited if module is reported else module
+                 for module in saved_reader_modules]
+            try:
+                (e, output, fresh) = read_election()
+            finally:
+                election_cache.READER_MODULES = saved_reader_modules
+        assert fresh
+        assert cache_key() != key
+
+    in_election_copy(test)
+
+
+def test_election_cache_warnings():
+    """
+    Check that a read giving warnings (which stops with an error) leaves
+    the cache as it was, that its warnings are printed through
+    utils.myprint, and that once the input is fixed the old cache is
+    used again.
+    """
+
+    def test():
+        read_election()
+        key = cache_key()
+        with open(outcomes_pathname()) as file:
+            outcomes = file.read()
+        with open(outcomes_pathname(), "a") as file:
+            file.write("con9,sel1\n")
+        (e, output, fresh) = read_election()
+        assert e == None and fresh
+        assert "WARNING:" in output and "FATAL ERROR:" in output
+        assert cache_key() == key
+        with open(outcomes_pathname(), "w") as file:
+            file.write(outcomes)
+        utils.warnings_given = 0
+        (e, output, fresh) = read_election()
+        assert not fresh
+
+    in_election_copy(test)
+
+
+if __name__ == "__main__":
+
+    test_election_cache_hit()
+    test_election_cache_input_changed()
+    test_election_cache_module_changed()
+    test_election_cache_warnings()
@@ -0,0 +1,131 @@
+# test_manifest.py
+# python3
+
+import manifest
+import utils
+
+
+def build_manifest(runs):
+    """
+    Return Manifest with a row for each (bid, num, box, position, stamp)
+    in runs, describing num ballots.
+    """
+
+    m = manifest.Manifest()
+    for (bid, num, box, position, stamp) in runs:
+        row = {"Ballot id": bid, "Box": box, "Position": position,
+               "Stamp": stamp, "Required Contests": "",
+               "Possible Contests": "", "Comments": ""}
+        m.add_row(row, num)
+    return m
+
+
+def expand_runs(runs):
+    """
+    Return list of (bid, box, position, stamp) for each ballot of runs,
+    expanded with utils.count_on as for a manifest file read one ballot
+    per row.
+    """
+
+    ballots = []
+    for (bid, num, box, position, stamp) in runs:
+        ballots.extend(zip(utils.count_on(bid, num),
+                           [box] * num,
+                           utils.count_on(position, num),
+                           utils.count_on(stamp, num)))
+    return ballots
+
+
+def check_manifest(runs, absent_bids):
+    """
+    Check the Manifest built from runs against the expansion of runs:
+    its sequence of bids, the index of each bid (that of its first
+    ballot), its field values, and whether its bids are distinct.
+    Bids in absent_bids should not be found.
+    """
+
+    m = build_manifest(runs)
+    ballots = expand_runs(runs)
+    bids = [bid for (bid, box, position, stamp) in ballots]
+
+    assert len(m) == len(bids)
+    assert list(m) == bids
+    assert [m[i] for i in range(len(m))] == bids
+    assert m[-1] == bids[-1]
+    assert m[1:4] == bids[1:4]
+
+    boxes = m.field("Box")
+    positions = m.field("Position")
+    stamps = m.field("Stamp")
+    for (bid, box, position, stamp) in ballots:
+        i = bids.index(bid)
+        assert m.get(bid) == i
+        assert m.index(bid) == i
+        assert bid in m
+        assert m.encode([bid])[0] == i
+        assert (boxes[bid], positions[bid], stamps[bid]) == ballots[i][1:]
+
+    for bid in absent_bids:
+        assert bid not in m
+        assert m.get(bid) == None
+        assert m.get(bid, -1) == -1
+        try:
+            m.index(bid)
+            assert False
+        except ValueError:
+            pass
+        try:
+            boxes[bid]
+            assert False
+        except KeyError:
+            pass
+
+    assert m.distinct() == (len(set(bids)) == len(bids))
+    return m
+
+
+def test_manifest_distinct():
+    """
+    Check a manifest with runs of several shapes and distinct bids: a
+    counter that widens ("A-98" to "A-100"), a bid without a counter
+    ("x" giving "x1", "x2", "x3"), single ballots, and two runs with the
+    same prefix, given out of order.
+    """
+
+    runs = [("A-98", 3, "Box1", "1", "S100"),
+            ("x", 3, "Box1", "4", "S200"),
+            ("B01", 1, "Box2", "1", "S300"),
+            ("B05", 2, "Box2", "2", "S301"),
+            ("B02", 3, "Box2", "4", "S303"),
+            ("y", 1, "Box3", "1", "S400")]
+    absent_bids = ["A-97", "A-101", "A-99x", "x", "x0", "x4",
+                   "B00", "B07", "y1", "z"]
+    m = check_manifest(runs, absent_bids)
+    assert m.distinct()
+
+
+def test_manifest_repeated():
+    """
+    Check manifests with repeated bids: overlapping runs, a single
+    ballot whose bid is also in a run, and a repeated single ballot.
+    The index of a repeated bid is that of its first ballot.
+    """
+
+    runs = [("B01", 3, "Box1", "1", "S1"),
+            ("B02", 2, "Box1", "4", "S4"),
+            ("x", 3, "Box2", "1", "S10")]
+    m = check_manifest(runs, ["B00", "B04", "x4"])
+    assert not m.distinct()
+
+    runs = [("A-98", 3, "Box1", "1", "S1"),
+            ("A-100", 1, "Box2", "1", "S4"),
+            ("y", 1, "Box3", "1", "S5"),
+            ("y", 1, "Box3", "2", "S6")]
+    m = check_manifest(runs, ["A-97", "A-101", "y1"])
+    assert not m.distinct()
+
+
+if __name__ == "__main__":
+
+    test_manifest_distinct()
+    test_manifest_repeated()
@@ -0,0 +1,158 @@
+# test_risk_analytic.py
+# python3
+
+import contextlib
+import io
+import math
+import numpy as np
+
+import benchmark
+import risk_analytic
+import risk_bayes
+import utils
+
+
+def close_contest_election(selids, n_ballots, n_errors, sample_size, seed=1):
+    """
+    Return election with one close plurality contest on selids in two
+    collections, each with n_ballots ballots; the first selid is the
+    reported winner, and n_errors of its reported votes in each
+    collection are actually for the second.
+    """
+
+    L = []
+    for pbcid in ["PBC1", "PBC2"]:
+        for (i, selid) in enumerate(selids):
+            count = n_ballots - i * n_ballots // 50
+            if i == 0:
+                count -= n_errors
+            L.append(("Contest1", pbcid, (selid,), (selid,), count))
+        L.append(("Contest1", pbcid, (selids[0],), (selids[1],), n_errors))
+    return benchmark.build_election(L, sample_size=sample_size, seed=seed)
+
+
+def analytic_and_vectorized_risks(e, trials):
+    """
+    Return (analytic risk, vectorized risk, standard error of vectorized
+    risk) for the first measurement of e, and the number of warnings
+    given while computing the analytic risk.
+    """
+
+    mid = e.mids[0]
+    plan = risk_bayes.compile_posterior_plan(e, e.cid_m[mid], e.sn_tcpra)
+    warnings_given = utils.warnings_given
+    with contextlib.redirect_stdout(io.StringIO()):
+        (analytic_risk, _) = risk_analytic.compute_risk_analytic(
+            e, plan, trials, np.random.RandomState(1))
+    warnings_given = utils.warnings_given - warnings_given
+    (vectorized_risk, _) = risk_bayes.compute_risk_vectorized(
+        e, plan, trials, np.random.RandomState(2))
+    se = risk_bayes.risk_standard_error(vectorized_risk, trials)
+    return (analytic_risk, vectorized_risk, se, warnings_given)
+
+
+def test_analytic_two_way(trials=100000):
+    """
+    Check that the Analytic risk of a two-way contest (computed exactly,
+    as by the beta engine) agrees with the vectorized risk to within
+    Monte Carlo error, without warnings.
+    """
+
+    e = close_contest_election(["Alice", "Bob"], 500, 5, 40)
+    (analytic_risk, vectorized_risk, se, warnings_given) = \
+        analytic_and_vectorized_risks(e, trials)
+    assert 0.01 < vectorized_risk < 0.99
+    assert abs(analytic_risk - vectorized_risk) < 4.0 * se
+    assert warnings_given == 0
+
+    print("Two-way risk:", analytic_risk, "analytic,",
+          vectorized_risk, "vectorized.")
+
+
+def test_analytic_multi_way(trials=100000):
+    """
+    Check that the Analytic risk of a three-way contest with large strata
+    (computed from the normal approximation) is roughly that of the
+    vectorized engine, and that a warning is given that it is rough.
+    """
+
+    e = close_contest_election(["Alice", "Bob", "Carol"], 20000, 100, 400)
+    (analytic_risk, vectorized_risk, se, warnings_given) = \
+        analytic_and_vectorized_risks(e, trials)
+    assert 0.01 < vectorized_risk < 0.99
+    # the approximation ignores the skew of the posterior (see
+    # risk_analytic.normal_is_accurate), so agreement is only rough
+    assert abs(analytic_risk - vectorized_risk) < 0.05
+    assert warnings_given == 1
+
+    print("Three-way risk:", analytic_risk, "analytic,",
+          vectorized_risk, "vectorized.")
+
+
+def binomial_betainc(a, b, x):
+    """
+    Return I_x(a, b) for positive integers a and b, as the chance that
+    a binomial(a+b-1, x) variable is at least a.
+    """
+
+    n = a + b - 1
+    return sum(math.comb(n, j) * x**j * (1.0 - x)**(n - j)
+               for j in range(a, n + 1))
+
+
+def test_betainc():
+    """
+    Check risk_analytic.betainc against known values: the closed forms
+    for a or b equal to one, symmetry at one half, and the binomial sums
+    for integer a and b (on both sides of the switch between the two
+    continued fractions).
+    """
+
+    x = np.array([0.0, 1e-6, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0 - 1e-6, 1.0])
+    assert np.allclose(risk_analytic.betainc(1.0, 1.0, x), x, atol=1e-12)
+    assert np.allclose(risk_analytic.betainc(3.5, 1.0, x), x**3.5, atol=1e-12)
+    assert np.allclose(risk_analytic.betainc(1.0, 2.5, x),
+                       1.0 - (1.0 - x)**2.5, atol=1e-12)
+    for a in [0.5, 7.0, 250.5]:
+        assert abs(risk_analytic.betainc(a, a, np.array([0.5]))[0] - 0.5) \
+            < 1e-12
+    for (a, b) in [(2, 3), (5, 1), (12, 30), (60, 240), (240, 60)]:
+        for xi in [0.05, 0.2, 0.3, 0.5, 0.8, 0.95]:
+            assert abs(risk_analytic.betainc(a, b, np.array([xi]))[0] -
+                       binomial_betainc(a, b, xi)) < 1e-10
+
+
+def test_beta_engine(trials=100000):
+    """
+    Check that the beta engine's risk for two-way contests agrees with
+    the vectorized risk to within Monte Carlo error, both for a contest
+    with only the two votes and for one that also has "-Invalid" votes
+    (which can't win).
+    """
+
+    elections = [close_contest_election(["Alice", "Bob"], 500, 5, 40),
+                 close_contest_election(["Alice", "Bob", "-Invalid"],
+                                        500, 5, 40)]
+    for e in elections:
+        mid = e.mids[0]
+        plan = risk_bayes.compile_posterior_plan(e, e.cid_m[mid], e.sn_tcpra)
+        assert risk_analytic.is_two_way(e, plan)
+        (beta_risk, beta_trials) = risk_analytic.compute_risk_beta(e, plan,
+                                                                   trials)
+        (vectorized_risk, _) = risk_bayes.compute_risk_vectorized(
+            e, plan, trials, np.random.RandomState(3))
+        se = risk_bayes.risk_standard_error(vectorized_risk, trials)
+        assert beta_trials == 0
+        assert 0.01 < vectorized_risk < 0.99
+        assert abs(beta_risk - vectorized_risk) < 4.0 * se
+
+        print("Two-way risk:", beta_risk, "beta,",
+              vectorized_risk, "vectorized.")
+
+
+if __name__ == "__main__":
+
+    test_analytic_two_way()
+    test_analytic_multi_way()
+    test_betainc()
+    test_beta_engine()
@@ -0,0 +1,432 @@
+# test_risk_bayes.py
+# python3
+
+import contextlib
+import io
+import numpy as np
+import tempfile
+
+import audit
+import benchmark
+import multi
+import risk_bayes
+import utils
+
+
+def stopping_election(limit, upset, chunk_trials, confidence):
+    """
+    Return multi.Election with one measurement "M1", with the given risk
+    limit and upset threshold, set up for risk_bayes.iter_risk_estimates.
+    """
+
+    e = multi.Election()
+    e.mids = ["M1"]
+    e.risk_limit_m["M1"] = limit
+    e.risk_upset_m["M1"] = upset
+    e.risk_measurement_parameters_m["M1"] = ("adaptive", "")
+    e.risk_chunk_trials = chunk_trials
+    e.risk_confidence = confidence
+    return e
+
+
+def test_stopping_error_rate(runs=2000, seed=1):
+    """
+    Check that the adaptive engine's early stopping decision is wrong
+    at most about 1 - e.risk_confidence of the time, however many
+    chunks it looks at.
+
+    The risk is put exactly at the risk limit, so stopping with the
+    measurement Passed (interval below the limit) is always wrong.  Each
+    chunk's wrong-outcome count is drawn directly from the binomial
+    distribution, so that only the stopping rule is tested.
+    """
+
+    limit = 0.05
+    e = stopping_election(limit, 0.5, chunk_trials=500, confidence=0.9)
+    rs = np.random.RandomState(seed)
+
+    def count_wrong_outcomes(e, plan, trials, rs):
+        return int(rs.binomial(trials, limit))
+
+    saved_count_wrong_outcomes = risk_bayes.count_wrong_outcomes
+    risk_bayes.count_wrong_outcomes = count_wrong_outcomes
+    try:
+        wrong_stops = 0
+        for run in range(runs):
+            for progress in risk_bayes.iter_risk_estimates(e, e.mids, None,
+                                                           50000, rs):
+                if progress.settled:
+                    break
+            if progress.settled and progress.hi < limit:
+                wrong_stops += 1
+    finally:
+        risk_bayes.count_wrong_outcomes = saved_count_wrong_outcomes
+
+    # one-sided errors; allow for Monte Carlo noise in the error rate
+    error_rate = wrong_stops / runs
+    assert error_rate <= (1.0 - e.risk_confidence) / 2.0 + 0.02
+
+    print("Wrong early stops:", wrong_stops, "of", runs, "runs.")
+
+
+def test_memory_budget_risk(trials=2000):
+    """
+    Check that the vectorized engine gives the same risk with no memory
+    budget as with budgets small enough to need many chunks.
+    """
+
+    L = benchmark.synthetic_spec(n_contests=1,
+                                 n_collections=3,
+                                 n_selections=3,
+                                 n_ballots=500)
+    e = benchmark.build_election(L, sample_size=40, seed=3)
+    benchmark.set_engine(e, "vectorized")
+    mid = e.mids[0]
+
+    risks = []
+    for budget in [None, 10**6, 10**4]:
+        e.risk_memory_budget = budget
+        risks.append(risk_bayes.compute_risk(e, mid, e.sn_tcpra, trials,
+                                             np.random.RandomState(1)))
+    assert risks[0] == risks[1] == risks[2]
+
+    print("Risk with and without memory budgets:", risks)
+
+
+def test_interrupted_status(trials=20000):
+    """
+    Check that a measurement whose adaptive risk computation is
+    interrupted stays Open, even though its partial risk estimate is
+    below the risk limit.
+    """
+
+    L = benchmark.synthetic_spec(n_contests=1,
+                                 n_collections=2,
+                                 n_selections=3,
+                                 n_ballots=500)
+    e = benchmark.build_election(L, sample_size=40, seed=5)
+    benchmark.set_engine(e, "adaptive")
+    e.saved_state = {"stage_time": "0000-00-00-00-00-00",
+                     "status_tm": {"0000-00-00-00-00-00":
+                                   {mid: "Open" for mid in e.mids}}}
+    e.status_tm[e.stage_time] = {}
+
+    def interrupt(e, progress):
+        raise KeyboardInterrupt
+
+    e.risk_progress_callback = interrupt
+    with contextlib.redirect_stdout(io.StringIO()):
+        risk_bayes.compute_risks(e, e.sn_tcpra, trials)
+    audit.compute_statuses(e)
+
+    for mid in e.mids:
+        assert mid in e.interrupted_mids
+        assert e.trials_tm[e.stage_time][mid] == e.risk_chunk_trials
+        assert e.risk_tm[e.stage_time][mid] < e.risk_limit_m[mid]
+        assert e.status_tm[e.stage_time][mid] == "Open"
+
+    print("Interrupted statuses:", e.status_tm[e.stage_time])
+
+
+def test_risk_engine():
+    """
+    Check that Param 1 names the engine only for Bayes measurements.
+    """
+
+    e = multi.Election()
+    e.risk_method_m = {"M1": "Bayes", "M2": "Bayes", "M3": "Analytic",
+                       "M4": "Frequentist"}
+    e.risk_measurement_parameters_m = {"M1": ("", ""),
+                                       "M2": (" Vectorized", ""),
+                                       "M3": ("vectorized", ""),
+                                       "M4": ("0.9", "")}
+    assert risk_bayes.risk_engine(e, "M1") == "scalar"
+    assert risk_bayes.risk_engine(e, "M2") == "vectorized"
+    assert risk_bayes.risk_engine(e, "M3") == "analytic"
+    assert risk_bayes.risk_engine(e, "M4") == "scalar"
+
+
+def test_check_confidence():
+    """
+    Check that audit.check_audit_spec accepts a blank or valid confidence
+    level (Param 2) for an adaptive measurement, and rejects others.
+    """
+
+    L = benchmark.synthetic_spec(n_contests=1,
+                                 n_collections=1,
+                                 n_selections=2,
+                                 n_ballots=100)
+    e = benchmark.build_election(L, sample_size=10)
+    mid = e.mids[0]
+    for confidence in ["", "0.95", " 0.5 ", "0", "1", "1.5", "high"]:
+        e.risk_measurement_parameters_m[mid] = ("adaptive", confidence)
+        utils.warnings_given = 0
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                audit.check_audit_spec(e)
+            accepted = True
+        except SystemExit:
+            accepted = False
+        assert accepted == (confidence in ["", "0.95", " 0.5 "])
+
+
+def tweak_election(seed=2):
+    """
+    Return election with one close two-way contest in two collections,
+    whose sample shows a few errors, so that its risk is neither near
+    zero nor near one.
+    """
+
+    L = []
+    for pbcid in ["PBC1", "PBC2"]:
+        L.append(("Contest1", pbcid, ("Alice",), ("Alice",), 250))
+        L.append(("Contest1", pbcid, ("Bob",), ("Bob",), 245))
+        L.append(("Contest1", pbcid, ("Alice",), ("Bob",), 5))
+    e = benchmark.build_election(L, sample_size=40, seed=seed)
+    benchmark.set_engine(e, "vectorized")
+    return e
+
+
+def test_crn_zero_tweak(trials=2000):
+    """
+    Check that with common random numbers, the risk for a zero tweak is
+    exactly the risk of the untweaked posterior simulated from the same
+    random stream, and that computing tweaked risks leaves e unchanged.
+    """
+
+    e = tweak_election()
+    mid = e.mids[0]
+    slack_p = risk_bayes.compute_slack_p(e)
+    zero_tweak_p = {pbcid: 0 for pbcid in e.pbcids}
+
+    crn = risk_bayes.common_random_numbers(e, trials, np.random.RandomState(1))
+    rs = np.random.RandomState(1)
+    rs.randint(2**31)           # as common_random_numbers does for its seed
+    plan = risk_bayes.compile_posterior_plan(e, e.cid_m[mid], e.sn_tcpra)
+    expected = risk_bayes.count_wrong_outcomes(e, plan, trials, rs) / trials
+    risk = risk_bayes.compute_risk_with_tweak(e, mid, slack_p, zero_tweak_p,
+                                              trials, crn)
+    assert risk == expected
+    assert 0.0 < risk < 1.0
+
+    tweak_p = {pbcid: 10 for pbcid in e.pbcids}
+    risk_bayes.compute_risk_with_tweak(e, mid, slack_p, tweak_p, trials, crn)
+    risk_bayes.compute_risk_with_tweak(e, mid, slack_p, tweak_p, trials)
+    assert e.risk_tm[e.stage_time] == {}
+    assert e.trials_tm[e.stage_time] == {}
+
+
+def test_crn_variance(trials=1000, runs=20):
+    """
+    Check that the difference between the risks of two tweaks varies
+    much less from run to run when both are computed from common random
+    numbers than when they are computed independently.
+    """
+
+    e = tweak_election()
+    mid = e.mids[0]
+    slack_p = risk_bayes.compute_slack_p(e)
+    tweak_a_p = {pbcid: 10 for pbcid in e.pbcids}
+    tweak_b_p = {pbcid: 20 for pbcid in e.pbcids}
+
+    crn_diffs = []
+    independent_diffs = []
+    for run in range(runs):
+        crn = risk_bayes.common_random_numbers(e, trials,
+                                               np.random.RandomState(run))
+        crn_diffs.append(
+            risk_bayes.compute_risk_with_tweak(e, mid, slack_p, tweak_a_p,
+                                               trials, crn) -
+            risk_bayes.compute_risk_with_tweak(e, mid, slack_p, tweak_b_p,
+                                               trials, crn))
+        independent_diffs.append(
+            risk_bayes.compute_risk_with_tweak(e, mid, slack_p, tweak_a_p,
+                                               trials) -
+            risk_bayes.compute_risk_with_tweak(e, mid, slack_p, tweak_b_p,
+                                               trials))
+    assert np.var(crn_diffs) < np.var(independent_diffs) / 2.0
+
+    print("Variance of risk differences: {} with common random numbers, "
+          "{} without.".format(np.var(crn_diffs), np.var(independent_diffs)))
+
+
+def changed_setting(value):
+    """ Return a value different from value, of a similar kind. """
+
+    if value == None:
+        return 10**6
+    if isinstance(value, bool):
+        return not value
+    if isinstance(value, str):
+        return value + "1"
+    return value * 2 + 1
+
+
+def test_risk_cache_key():
+    """
+    Check that the risk cache key changes when any engine setting, or
+    the sample tally, changes.
+    """
+
+    e = tweak_election()
+    mids = e.mids[:1]
+    key = risk_bayes.risk_cache_key(e, mids, e.sn_tcpra)
+    for setting in risk_bayes.RISK_ENGINE_SETTINGS:
+        value = getattr(e, setting)
+        setattr(e, setting, changed_setting(value))
+        assert risk_bayes.risk_cache_key(e, mids, e.sn_tcpra) != key, setting
+        setattr(e, setting, value)
+    assert risk_bayes.risk_cache_key(e, mids, e.sn_tcpra) == key
+
+    sn_pra = e.sn_tcpra[e.stage_time][e.cid_m[mids[0]]]["PBC1"]
+    sn_pra[("Alice",)][("Alice",)] += 1
+    assert risk_bayes.risk_cache_key(e, mids, e.sn_tcpra) != key
+
+
+def test_risk_cache_hit(trials=2000):
+    """
+    Check that risks read from the risk cache have the same risk,
+    trials, standard error, and effective sample size as when they were
+    computed.  (The importance engine is used, so that the standard
+    error and effective sample size aren't those of plain trials.)
+    """
+
+    e = tweak_election()
+    benchmark.set_engine(e, "importance")
+    e.use_risk_cache = True
+    saved_elections_root = multi.ELECTIONS_ROOT
+    with tempfile.TemporaryDirectory() as elections_root:
+        multi.ELECTIONS_ROOT = elections_root
+        try:
+            risk_bayes.compute_risks(e, e.sn_tcpra, trials)
+            computed = [dict(e.risk_tm[e.stage_time]),
+                        dict(e.trials_tm[e.stage_time]),
+                        dict(e.risk_se_tm[e.stage_time]),
+                        dict(e.ess_tm[e.stage_time])]
+            for table in [e.risk_tm, e.trials_tm, e.risk_se_tm, e.ess_tm]:
+                table[e.stage_time] = {}
+            e.timings_t[e.stage_time] = []
+            risk_bayes.compute_risks(e, e.sn_tcpra, trials)
+        finally:
+            multi.ELECTIONS_ROOT = saved_elections_root
+
+    phases = [record["Phase"] for record in e.timings_t[e.stage_time]]
+    assert "risk_cache_hit" in phases and "compute_risk" not in phases
+    assert [e.risk_tm[e.stage_time],
+            e.trials_tm[e.stage_time],
+            e.risk_se_tm[e.stage_time],
+            e.ess_tm[e.stage_time]] == computed
+    mid = e.mids[0]
+    assert e.ess_tm[e.stage_time][mid] < trials
+    assert e.risk_se_tm[e.stage_time][mid] > 0.0
+
+
+def control_risks(e, trials, runs):
+    """
+    Return (risks, standard errors) computed by the control engine for
+    the first measurement of e, in runs runs with different seeds.
+    """
+
+    mid = e.mids[0]
+    plan = risk_bayes.compile_posterior_plan(e, e.cid_m[mid], e.sn_tcpra)
+    risks = []
+    ses = []
+    for run in range(runs):
+        (risk, _, se) = risk_bayes.compute_risk_control(
+            e, plan, trials, np.random.RandomState(run))
+        risks.append(risk)
+        ses.append(se)
+    return (np.array(risks), np.array(ses))
+
+
+def test_control_standard_error(runs=100):
+    """
+    Check that the standard errors reported by the control engine match
+    the spread of its risks across seeds, both for a moderate risk (where
+    the controls reduce the error well below the binomial standard
+    error) and for a small one (where the engine falls back to the plain
+    estimate).
+    """
+
+    e = tweak_election()
+    (risks, ses) = control_risks(e, 2000, runs)
+    assert 0.75 < ses.mean() / risks.std() < 1.33
+    assert ses.mean() < 0.75 * risk_bayes.risk_standard_error(risks.mean(),
+                                                               2000)
+
+    L = benchmark.synthetic_spec(n_contests=1,
+                                 n_collections=5,
+                                 n_selections=3,
+                                 n_ballots=2000)
+    e = benchmark.build_election(L, sample_size=200, seed=1)
+    (risks, ses) = control_risks(e, 10000, runs)
+    assert risks.mean() < 0.01
+    assert 0.75 < ses.mean() / risks.std() < 1.33
+
+    print("Control engine standard errors match spread across seeds.")
+
+
+def test_importance_low_ess(trials=10000):
+    """
+    Check that the importance engine keeps its estimate, with a nonzero
+    standard error, when the effective sample size is large enough, and
+    otherwise warns and falls back to the vectorized engine.
+    """
+
+    for (n_collections, n_selections, n_ballots, sample_size, fallback) in \
+            [(5, 3, 2000, 200, False), (2, 5, 200, 40, True)]:
+        L = benchmark.synthetic_spec(n_contests=1,
+                                     n_collections=n_collections,
+                                     n_selections=n_selections,
+                                     n_ballots=n_ballots)
+        e = benchmark.build_election(L, sample_size=sample_size, seed=1)
+        mid = e.mids[0]
+        plan = risk_bayes.compile_posterior_plan(e, e.cid_m[mid], e.sn_tcpra)
+        warnings_given = utils.warnings_given
+        with contextlib.redirect_stdout(io.StringIO()):
+            (risk, trials_done, se, ess) = risk_bayes.compute_risk_importance(
+                e, plan, trials, np.random.RandomState(1))
+        assert (utils.warnings_given > warnings_given) == fallback
+        assert trials_done == trials
+        if fallback:
+            assert ess == trials
+        else:
+            assert risk_bayes.IMPORTANCE_MIN_ESS_FRACTION * trials <= ess < trials
+            assert 0.0 < se < risk
+
+
+def test_risk_estimates_kept(trials=5000):
+    """
+    Check that the progress objects yielded by iter_risk_estimates may
+    be kept: each records the state after its own chunk.
+    """
+
+    e = tweak_election()
+    benchmark.set_engine(e, "adaptive")
+    # limits at the risk (about 0.13), so the risk's status isn't settled
+    e.risk_limit_m[e.mids[0]] = e.risk_upset_m[e.mids[0]] = 0.13
+    plan = risk_bayes.compile_posterior_plan(e, e.cid_m[e.mids[0]],
+                                             e.sn_tcpra)
+    progresses = list(risk_bayes.iter_risk_estimates(
+        e, e.mids, plan, trials, np.random.RandomState(1)))
+    assert [progress.trials_done for progress in progresses] == \
+        list(range(e.risk_chunk_trials, trials + 1, e.risk_chunk_trials))
+    assert [progress.done for progress in progresses] == \
+        [False] * (len(progresses) - 1) + [True]
+    assert progresses[-1].wrong_outcome_count > progresses[0].wrong_outcome_count
+
+
+if __name__ == "__main__":
+
+    test_stopping_error_rate()
+    test_memory_budget_risk()
+    test_interrupted_status()
+    test_risk_engine()
+    test_check_confidence()
+    test_crn_zero_tweak()
+    test_crn_variance()
+    test_risk_cache_key()
+    test_risk_cache_hit()
+    test_control_standard_error()
+    test_importance_low_ess()
+    test_risk_estimates_kept()
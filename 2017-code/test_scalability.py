@@ -1,70 +1,117 @@
 # test_scalability.py
 # Ronald L. Rivest with Huasyn Karimi
 
-import syn2
 import time
-import structure
 
-def tester(se):
+import benchmark
+import reported
+import risk_bayes
 
-    # copy code here from syn2.test; modify as needed
-    se.seed = 9
 
-    syn2.generate_election_structure(se)
-    structure.finish_election_structure(se)
-    syn2.generate_contests(se)
-    syn2.generate_contest_groups(se)
-    syn2.generate_collections(se)
-
-    syn2.generate_reported(se)
-    syn2.generate_ballot_manifest(se)
-
-    syn2.generate_audited_votes(se)
+def run_scale(k, trials=1000):
+    """
+    Build synthetic election of scale k (see test_scale), draw its
+    sample, and compute its risks; return the election.
+    """
 
-    
-    for key in sorted(vars(se)):
-        print(key)
-        print("    ", vars(se)[key])
-    
+    # election is built as in benchmark.py (from a syn2-style spec)
+    L = benchmark.synthetic_spec(n_contests=10,
+                                 n_collections=10**(k-3),
+                                 n_selections=10,
+                                 n_ballots=100)
+    e = benchmark.build_election(L, sample_size=40, seed=9)
+    benchmark.set_engine(e, "vectorized")
+    risk_bayes.compute_risks(e, e.sn_tcpra, trials)
+    return e
 
-    print("Checking structure:", structure.check_election_structure(se))
-    
-    syn2.write_structure_csvs(se)
-    syn2.write_reported(se)
-    syn2.write_audit(se)
 
-def test_scale(k):
+def test_scale(k=3):
 
     """
-    For various values of k = 3, 4, ... 
+    For various values of k = 3, 4, ...
     generate an election with
-     10**k voters
+     10**k ballots
      10**(k-3) pbcids
-     10**(k-2) cids
+     10 cids (each on 100 ballots per pbcid)
      10 selids / cid
      """
     # start timer
-    start = time.time() 
-
-    # ... set parameters here based on k
-    se = syn2.SynElection()
-    se.min_n_bids_per_pbcid = 10**3
-    se.max_n_bids_per_pbcid = 10**3
-    se.n_pbcids = 10**(k-3)
-    se.min_n_selids_per_cid = 10
-    se.max_n_selids_per_cid = 10
+    start = time.time()
 
     # run "test"
-    tester(se) 
+    e = run_scale(k)
 
     # stop timer; print k and elapsed time
-    end = time.time() 
+    end = time.time()
+
+    assert sum(len(e.bids_p[pbcid]) for pbcid in e.pbcids) == 10**k
+    assert set(e.risk_tm[e.stage_time]) == set(e.mids)
+    assert all(0.0 <= risk <= 1.0 for risk in e.risk_tm[e.stage_time].values())
 
     print("For k=", k, ",", end-start, "seconds elapsed.")
 
 
-for k in range(3, 8):
-    test_scale(k)
+def reported_counts_by_scanning(e):
+    """
+    Return (rn_cpr, rn_c, rn_p, rn_cr) for e, computed the slow way: by
+    scanning the ballots of each collection once per reported vote.
+    """
+
+    rn_cpr = {}
+    for cid in e.cids:
+        rn_cpr[cid] = {}
+        for pbcid in e.possible_pbcid_c[cid]:
+            rn_cpr[cid][pbcid] = {}
+            for rv in e.votes_c[cid]:
+                rn_cpr[cid][pbcid][rv] = len([bid for bid in e.bids_p[pbcid]
+                                              if bid in e.rv_cpb[cid][pbcid] and
+                                              e.rv_cpb[cid][pbcid][bid] == rv])
+    rn_c = {cid: sum(rn_cpr[cid][pbcid][rv]
+                     for pbcid in rn_cpr[cid]
+                     for rv in e.votes_c[cid])
+            for cid in e.cids}
+    rn_p = {pbcid: sum(rn_cpr[cid][pbcid][rv]
+                       for cid in rn_cpr
+                       for rv in e.votes_c[cid])
+            for pbcid in e.pbcids}
+    rn_cr = {cid: {rv: sum(rn_cpr[cid][pbcid][rv] for pbcid in rn_cpr[cid])
+                   for rv in e.votes_c[cid]}
+             for cid in e.cids}
+    return (rn_cpr, rn_c, rn_p, rn_cr)
+
+
+def test_reported_counts(k=3):
+    """
+    For an election of scale k (as for test_scale), check that
+    reported.compute_reported_counts gives the same counts as scanning
+    the ballots once per reported vote, and print how long each took.
+    """
+
+    L = benchmark.synthetic_spec(n_contests=10,
+                                 n_collections=10**(k-3),
+                                 n_selections=10,
+                                 n_ballots=100)
+    e = benchmark.build_election(L, sample_size=40, seed=9)
+
+    start = time.time()
+    reported.compute_reported_counts(e)
+    fast = time.time() - start
+
+    start = time.time()
+    expected = reported_counts_by_scanning(e)
+    slow = time.time() - start
+
+    assert (e.rn_cpr, e.rn_c, e.rn_p, e.rn_cr) == expected
+    assert sum(e.rn_p.values()) == 10**k
+    assert all(isinstance(e.rn_c[cid], int) for cid in e.cids)
+
+    print("For k=", k, ",", fast, "seconds for reported counts,",
+          slow, "seconds by scanning.")
+
+
+if __name__ == "__main__":
 
-    
-    
+    for k in range(3, 6):
+        test_scale(k)
+    for k in range(3, 6):
+        test_reported_counts(k)
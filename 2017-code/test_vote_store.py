@@ -0,0 +1,63 @@
+# test_vote_store.py
+# python3
+
+import contextlib
+import io
+import numpy as np
+
+import benchmark
+import outcomes
+import utils
+import vote_store
+
+
+def test_sample_tally2(sample_size=40):
+    """
+    Check that the sample tallies drawn from the columnar vote store
+    are those outcomes.compute_tally2 gives for the (actual, reported)
+    pairs of the sampled ballots, read from the dicts e.av_cpb and
+    e.rv_cpb (which benchmark elections keep).
+    """
+
+    L = benchmark.synthetic_spec(n_contests=3, n_collections=2,
+                                 n_selections=4, n_ballots=100)
+    e = benchmark.build_election(L, sample_size=sample_size, seed=4)
+    for cid in e.cids:
+        for pbcid in e.possible_pbcid_c[cid]:
+            bids = e.bids_p[pbcid][:sample_size]
+            vec = [(e.av_cpb[cid][pbcid].get(bid, vote_store.NO_SUCH_CONTEST),
+                    e.rv_cpb[cid][pbcid].get(bid, vote_store.NO_SUCH_CONTEST))
+                   for bid in bids]
+            assert e.sn_tcpra[e.stage_time][cid][pbcid] == \
+                outcomes.compute_tally2(vec)
+
+
+def test_unknown_votes():
+    """
+    Check that encoding votes for a bid or cid not in the election gives
+    a warning for each, and leaves the arrays as they would be without
+    those votes.
+    """
+
+    L = benchmark.synthetic_spec(n_contests=1, n_collections=1,
+                                 n_selections=2, n_ballots=10)
+    e = benchmark.build_election(L, sample_size=5)
+    cid = e.cids[0]
+    pbcid = e.pbcids[0]
+    (code_cp, present_cp) = vote_store.encode_votes(e, e.av_cpb, "av_cpb")
+
+    av_cpb = {cid: {pbcid: dict(e.av_cpb[cid][pbcid])},
+              "NoSuchCid": {pbcid: {}}}
+    av_cpb[cid][pbcid]["NoSuchBid"] = ("Alice",)
+    warnings_given = utils.warnings_given
+    with contextlib.redirect_stdout(io.StringIO()):
+        (code2_cp, present2_cp) = vote_store.encode_votes(e, av_cpb, "av_cpb")
+    assert utils.warnings_given - warnings_given == 2
+    assert np.array_equal(code_cp[cid][pbcid], code2_cp[cid][pbcid])
+    assert np.array_equal(present_cp[cid][pbcid], present2_cp[cid][pbcid])
+
+
+if __name__ == "__main__":
+
+    test_sample_tally2()
+    test_unknown_votes()
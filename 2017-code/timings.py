@@ -0,0 +1,94 @@
+# timings.py
+# python3
+
+"""
+Routines to record where the time of an audit stage goes.
+
+Each timing is a dict (a "timing record") with keys given by
+TIMING_FIELDNAMES: the phase of the audit stage, the measurements it
+was for (if any), the wall-clock and CPU seconds it took, and counts
+such as the number of trials run, strata simulated, or rows read.
+Records for a stage are kept in e.timings_t[e.stage_time], and written
+out by write_audit_output_timings to
+    3-audit/34-audit-output/audit-output-timings-STAGETIME.csv
+"""
+
+import contextlib
+import os
+import time
+
+import multi
+
+
+TIMING_FIELDNAMES = ["Phase",
+                     "Measurements",
+                     "Wall seconds",
+                     "CPU seconds",
+                     "Trials",
+                     "Strata",
+                     "Rows"]
+
+
+def add_timing(e, phase, mids=(), wall=0.0, cpu=0.0, **counts):
+    """
+    Add and return timing record for given phase (a string) and
+    measurements mids, taking wall and cpu seconds.  Keyword arguments
+    counts give the counts (Trials=..., Strata=..., Rows=...).
+    """
+
+    record = {"Phase": phase,
+              "Measurements": " ".join(mids),
+              "Wall seconds": wall,
+              "CPU seconds": cpu}
+    record.update(counts)
+    e.timings_t.setdefault(e.stage_time, []).append(record)
+    return record
+
+
+@contextlib.contextmanager
+def timed(e, phase, mids=(), **counts):
+    """
+    Context manager timing the enclosed code as the given phase, for
+    measurements mids.  Yields the timing record, so that counts known
+    only after the code has run may be filled in:
+
+        with timings.timed(e, "read_audited_votes") as record:
+            ...
+            record["Rows"] = n_rows
+    """
+
+    record = add_timing(e, phase, mids, **counts)
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        yield record
+    finally:
+        record["Wall seconds"] = time.perf_counter() - start_wall
+        record["CPU seconds"] = time.process_time() - start_cpu
+
+
+def write_audit_output_timings(e):
+    """
+    Write timing records for the current stage to
+    3-audit/34-audit-output/audit-output-timings-STAGETIME.csv
+    """
+
+    dirpath = os.path.join(multi.ELECTIONS_ROOT,
+                           e.election_dirname,
+                           "3-audit",
+                           "34-audit-output")
+    os.makedirs(dirpath, exist_ok=True)
+    filename = os.path.join(dirpath,
+                            "audit-output-timings-"+e.stage_time+".csv")
+    with open(filename, "w") as file:
+        file.write(",".join(TIMING_FIELDNAMES))
+        file.write("\n")
+        for record in e.timings_t.get(e.stage_time, []):
+            values = []
+            for fieldname in TIMING_FIELDNAMES:
+                value = record.get(fieldname, "")
+                if isinstance(value, float):
+                    value = "{:.6f}".format(value)
+                values.append("{}".format(value))
+            file.write(",".join(values))
+            file.write("\n")
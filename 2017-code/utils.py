@@ -70,7 +70,7 @@ def close_myprint_files():
 def myerror(msg):
     """ Print error message and halt immediately """
 
-    print("FATAL ERROR:", msg)
+    myprint("FATAL ERROR:", msg)
     quit()
 
 
@@ -84,7 +84,7 @@ def mywarning(msg):
 
     global warnings_given
     warnings_given += 1
-    print("WARNING:", msg)
+    myprint("WARNING:", msg)
 
 
 ##############################################################################
@@ -191,6 +191,36 @@ def count_on(start, num):
     return ans
 
 
+def count_on_parse(start):
+    """
+    Return triple (prefix, counter, width) for string start, such that
+    for num > 1, count_on(start, num)[i] is prefix followed by counter+i
+    written with at least width digits.
+    """
+
+    n_prefix = len(start)
+    while n_prefix > 0 and start[n_prefix-1].isdigit():
+        n_prefix -= 1
+    digits = start[n_prefix:]
+    if digits == "":
+        digits = "1"
+    return (start[:n_prefix], int(digits), len(digits))
+
+
+def count_on_item(start, num, i):
+    """
+    Return count_on(start, num)[i], without computing the whole list.
+    """
+
+    assert 0 <= i < num
+    if num == 1:
+        return start
+    if isinstance(start, int):
+        return start + i
+    (prefix, counter, width) = count_on_parse(start)
+    return prefix + "{:0{}d}".format(counter + i, width)
+
+
 def test_count_on():
 
     for start, num in [(1,3), ("x", 3), ("A-98", 3), ("y", 1)]:
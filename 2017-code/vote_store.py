@@ -0,0 +1,180 @@
+# vote_store.py
+# python3
+
+"""
+Columnar store of reported and audited votes.
+
+The readers collect votes in three-level dicts
+e.rv_cpb[cid][pbcid][bid] and av_cpb[cid][pbcid][bid], one tuple per
+ballot per contest.  Once read, the votes are encoded into numpy arrays
+kept, for each cid and each pbcid in e.possible_pbcid_c[cid], aligned
+with the ballots of e.bids_p[pbcid] (position i being ballot
+e.bids_p[pbcid][i]):
+
+    e.rv_code_cp[cid][pbcid]     code (in e.vote_symbols_c[cid]; see
+                                 symbols.py) of each ballot's reported
+                                 vote, or NO_VOTE
+    e.rv_present_cp[cid][pbcid]  True where the ballot has a reported
+                                 vote for cid (False stands for the vote
+                                 ("-NoSuchContest",))
+
+and likewise e.av_code_cp and e.av_present_cp for the audited votes
+(False there meaning the ballot has not been audited for cid).
+
+Validation, reported counts, and sample tallies all work on the arrays.
+On the audit path the dicts are not kept: reported.read_reported empties
+e.rv_cpb once the store is built, and audit.read_audited_votes encodes
+the votes it reads without keeping them.  (The synthetic-election
+generators and CSV writers still build and read the dicts.)
+"""
+
+import numpy as np
+
+import utils
+
+# Code for a ballot with no vote for the contest.
+NO_VOTE = -1
+
+NO_SUCH_CONTEST = ("-NoSuchContest",)
+
+
+def encode_votes(e, votes_cpb, name):
+    """
+    Return pair (code_cp, present_cp) of dicts of arrays (see above) for
+    the votes in votes_cpb (e.rv_cpb or av_cpb; name is used in
+    warnings).  Votes not yet in e.vote_symbols_c[cid] are added to it.
+    Give a warning for each cid, pbcid, or bid in votes_cpb that is not
+    in the election, since its votes have no place in the arrays.
+    """
+
+    for cid in votes_cpb:
+        if cid not in e.cids:
+            utils.mywarning("{} key `{}` is not in e.cids.".format(name, cid))
+            continue
+        for pbcid in votes_cpb[cid]:
+            if pbcid not in e.pbcids:
+                utils.mywarning("{}[{}] key `{}` is not in e.pbcids."
+                                .format(name, cid, pbcid))
+
+    code_cp = {}
+    present_cp = {}
+    for cid in e.cids:
+        code_cp[cid] = {}
+        present_cp[cid] = {}
+        vote_symbols = e.vote_symbols_c[cid]
+        for pbcid in e.possible_pbcid_c[cid]:
+            votes_b = votes_cpb.get(cid, {}).get(pbcid, {})
+            bid_symbols = e.bid_symbols_p[pbcid]
+            positions = bid_symbols.encode(votes_b)
+            known = positions >= 0
+            if not known.all():
+                for (bid, is_known) in zip(votes_b, known):
+                    if not is_known:
+                        utils.mywarning("bid `{}` from {}[{}][{}] is not in "
+                                        "e.bids_p[{}]."
+                                        .format(bid, name, cid, pbcid, pbcid))
+            if len(bid_symbols) == len(e.bids_p[pbcid]):
+                code = np.full(len(bid_symbols), NO_VOTE, dtype=np.int32)
+                votes = [vote for (vote, is_known)
+                         in zip(votes_b.values(), known) if is_known]
+                code[positions[known]] = \
+                    np.fromiter((vote_symbols.add(vote) for vote in votes),
+                                dtype=np.int32, count=len(votes))
+            else:
+                # repeated bids; look each position up separately
+                code = np.fromiter((vote_symbols.add(votes_b[bid])
+                                    if bid in votes_b else NO_VOTE
+                                    for bid in e.bids_p[pbcid]),
+                                   dtype=np.int32,
+                                   count=len(e.bids_p[pbcid]))
+            code_cp[cid][pbcid] = code
+            present_cp[cid][pbcid] = code != NO_VOTE
+    return (code_cp, present_cp)
+
+
+def build_reported_vote_store(e):
+    """ Set e.rv_code_cp and e.rv_present_cp from e.rv_cpb. """
+
+    (e.rv_code_cp, e.rv_present_cp) = encode_votes(e, e.rv_cpb, "e.rv_cpb")
+
+
+def build_audited_vote_store(e, av_cpb):
+    """ Set e.av_code_cp and e.av_present_cp from av_cpb. """
+
+    (e.av_code_cp, e.av_present_cp) = encode_votes(e, av_cpb, "av_cpb")
+
+
+def decode_vote(e, cid, code):
+    """ Return vote with given code for cid (NO_VOTE giving NO_SUCH_CONTEST). """
+
+    if code == NO_VOTE:
+        return NO_SUCH_CONTEST
+    return e.vote_symbols_c[cid].symbol(code)
+
+
+def ballot_codes(e, cid, pbcid, code_cp, present_cp, sample_size=None):
+    """
+    Return array of vote codes for the ballots of pbcid (the first
+    sample_size of them, if given) in code_cp and present_cp
+    (e.rv_code_cp and e.rv_present_cp, or e.av_code_cp and
+    e.av_present_cp), with ballots having no vote for cid given the
+    code of NO_SUCH_CONTEST (or NO_VOTE, if that vote has no code for
+    cid).
+    """
+
+    code = code_cp[cid][pbcid][:sample_size]
+    no_such_contest = e.vote_symbols_c[cid].get(NO_SUCH_CONTEST, NO_VOTE)
+    if no_such_contest != NO_VOTE:
+        code = np.where(present_cp[cid][pbcid][:sample_size],
+                        code, no_such_contest)
+    return code
+
+
+def sample_tally2(e, cid, pbcid, sample_size):
+    """
+    Return the sample tally for the first sample_size ballots of pbcid
+    in contest cid: a dict mapping each reported vote rv to a dict
+    mapping each actual vote av to the number of sampled ballots with
+    that (reported, actual) pair.  Ballots with no reported (or
+    audited) vote for cid count as NO_SUCH_CONTEST.
+
+    Same as outcomes.compute_tally2 applied to the list of (av, rv)
+    pairs of the sample, down to the order of the keys (by first
+    appearance in the sample).
+    """
+
+    rv = ballot_codes(e, cid, pbcid, e.rv_code_cp, e.rv_present_cp,
+                      sample_size).astype(np.int64)
+    av = ballot_codes(e, cid, pbcid, e.av_code_cp, e.av_present_cp,
+                      sample_size).astype(np.int64)
+    base = len(e.vote_symbols_c[cid]) + 1
+    pairs = (rv + 1) * base + (av + 1)
+    (pair_values, pair_firsts, pair_counts) = \
+        np.unique(pairs, return_index=True, return_counts=True)
+    (rv_values, rv_firsts) = np.unique(rv, return_index=True)
+    rv_first = dict(zip(rv_values.tolist(), rv_firsts.tolist()))
+    order = sorted(range(len(pair_values)),
+                   key=lambda k: (rv_first[pair_values[k] // base - 1],
+                                  pair_firsts[k]))
+    tally2 = {}
+    for k in order:
+        (rv_code, av_code) = divmod(int(pair_values[k]), base)
+        rv_vote = decode_vote(e, cid, rv_code - 1)
+        av_vote = decode_vote(e, cid, av_code - 1)
+        utils.nested_set(tally2, [rv_vote, av_vote], int(pair_counts[k]))
+    return tally2
+
+
+def reported_vote_counts(e, cid, pbcid, sample_size=None):
+    """
+    Return array giving, for each code of e.vote_symbols_c[cid], the
+    number of ballots of pbcid (the first sample_size of them, if given)
+    with that reported vote; ballots with no reported vote for cid count
+    as NO_SUCH_CONTEST if that vote has a code, and are not counted
+    otherwise.
+    """
+
+    code = ballot_codes(e, cid, pbcid, e.rv_code_cp, e.rv_present_cp,
+                        sample_size)
+    return np.bincount(code[code != NO_VOTE],
+                       minlength=len(e.vote_symbols_c[cid]))